@@ -0,0 +1,137 @@
+from __future__ import division
+
+import traceback
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import cpu_count
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from blade import Bamberger
+
+def _identity(t):
+	'''Default chordwise parameter distribution; module-level so it can be sent to worker processes'''
+	return t
+
+def _blade(params):
+	'''Bamberger from a dict of keyword arguments or a sequence of positional arguments'''
+	return Bamberger(**params) if isinstance(params, dict) else Bamberger(*params)
+
+def _run(shape, f, jobs):
+	'''Worker: generates each (index, params, shm_name) job into its shared-memory block, returning (index, error) pairs'''
+	out = []
+	for index, params, name in jobs:
+		try:
+			shm = SharedMemory(name=name)
+			try:
+				pts = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+				_blade(params).gen_arr(shape[1], shape[2], f, out=pts)
+				del pts
+			finally:
+				shm.close()
+			out.append((index, None))
+		except Exception:
+			out.append((index, traceback.format_exc()))
+	return out
+
+class Result(object):
+	'''Outcome of one design in a sweep, with points held in shared memory until self.close()'''
+
+	def __init__(self, index, params, shm=None, shape=None, error=None):
+		'''Stores job position as self.index, its inputs as self.params and either the generated points as self.pts or a traceback as self.error'''
+		self.index = index
+		self.params = params
+		self.error = error
+
+		self.shm = shm
+		self.pts = None if shm is None else np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+	def ok(self):
+		'''True if the design generated without error'''
+		return self.error is None
+
+	def close(self):
+		'''Releases the shared memory behind self.pts, which must not be used afterwards'''
+		self.pts = None
+		if self.shm is not None:
+			self.shm.close()
+			self.shm.unlink()
+			self.shm = None
+
+def sweep(params, num_secs, num_pts, f=None, workers=None, chunksize=1, ordered=True, max_pending=None):
+	'''Generates Bamberger(*params).gen_arr(num_secs, num_pts, f) for every parameter set on a process pool, yielding a Result per design
+
+	Each design's (2, num_secs, num_pts, 3) points are written by the worker directly into a shared-memory block owned by the caller, so no point data is pickled. Designs go to workers chunksize at a time with at most max_pending chunks (default 2 per worker) in flight; results stream in input order if ordered, else as chunks finish. A design that raises is reported through Result.error without affecting the rest of the sweep. f must be picklable, i.e. a module-level function.
+	'''
+	shape = (2, num_secs, num_pts, 3)
+	nbytes = 2*num_secs*num_pts*3*np.dtype(np.float64).itemsize
+
+	workers = cpu_count() if workers is None else workers
+	max_pending = 2*workers if max_pending is None else max_pending
+	f = _identity if f is None else f
+
+	jobs = iter(enumerate(params))
+
+	def take():
+		'''Next chunk of (index, params, shm) jobs, each with freshly allocated shared memory'''
+		chunk = []
+		for index, p in jobs:
+			chunk.append((index, p, SharedMemory(create=True, size=nbytes)))
+			if len(chunk) == chunksize:
+				break
+		return chunk
+
+	def collect(fut, chunk):
+		'''Results for a finished chunk in input order'''
+		try:
+			errors = dict(fut.result())
+		except Exception:
+			errors = dict([(index, traceback.format_exc()) for index, p, shm in chunk])
+
+		out = []
+		for index, p, shm in chunk:
+			if errors.get(index) is None:
+				out.append(Result(index, p, shm, shape))
+			else:
+				shm.close()
+				shm.unlink()
+				out.append(Result(index, p, error=errors[index]))
+		return out
+
+	with ProcessPoolExecutor(workers) as pool:
+		pending = deque()
+
+		def submit():
+			'''Submits the next chunk, returning False once jobs are exhausted'''
+			chunk = take()
+			if chunk == []:
+				return False
+			pending.append((pool.submit(_run, shape, f, [(index, p, shm.name) for index, p, shm in chunk]), chunk))
+			return True
+
+		while len(pending) < max_pending and submit():
+			pass
+
+		try:
+			while pending:
+				if ordered:
+					fut, chunk = pending.popleft()
+				else:
+					done, not_done = wait([it[0] for it in pending], return_when=FIRST_COMPLETED)
+					fut, chunk = next(it for it in pending if it[0] in done)
+					pending.remove((fut, chunk))
+
+				submit()
+
+				for res in collect(fut, chunk):
+					yield res
+		finally:
+			# Sweep abandoned early: release blocks whose results were never handed out
+			for fut, chunk in pending:
+				fut.cancel()
+				wait([fut])
+				for index, p, shm in chunk:
+					shm.close()
+					shm.unlink()
@@ -0,0 +1,182 @@
+from __future__ import division, print_function
+
+import sys
+import json
+import tracemalloc
+
+from argparse import ArgumentParser
+from timeit import Timer, default_timer as timer
+
+from function import Sum, Product, Composite, Sin, Cos, Power, Constant
+from helper import linspace, interp
+from linalg import Matrix, Vector
+from blade import Bamberger, NACA4m
+
+def deep_tree(depth):
+	'''Function tree of the given depth in which each level reuses the previous level twice'''
+	f = Sin(1.3, 0.2)
+	for i in range(depth):
+		f = Sum([Product([f, Cos(0.7, 0.1*i)]), Composite(Sin(0.5), f), Power(0.1, 2), Constant(0.5)])
+	return f
+
+def best_of(fn, repeat=5):
+	'''Median wall time in seconds per call of fn over repeat runs, each of enough calls to take at least 0.2 s'''
+	clock = Timer(fn)
+	number = clock.autorange()[0]
+	return sorted(clock.repeat(repeat, number))[repeat//2]/number
+
+def bench_compile(depth=8, num_pts=1000, repeat=5):
+	'''Tree-walking versus compiled evaluation of deep_tree(depth) at num_pts parameters'''
+	import numpy as np
+
+	f = deep_tree(depth)
+	t = linspace(0, 1, num_pts)
+	arr = np.array(t)
+
+	start = timer()
+	kern = f.compile()
+	compile_time = timer() - start
+
+	walk = best_of(lambda: [f(it) for it in t], repeat)
+	flat = best_of(lambda: kern(arr), repeat)
+
+	return {'depth': depth, 'num_pts': num_pts, 'compile': compile_time, 'walk': walk, 'compiled': flat, 'speedup': walk/flat}
+
+def bamberger():
+	'''Reference blade for generation benchmarks'''
+	return Bamberger(0.381, 0.387, 0.5, [0.33, 0.13, 0.12], [0, 0.056, 0.059], [0.7, 0.2, 0.56], [0.12, 0.05, 0.051], [0.13, 0.1, 0.33], [0, 0.0855, 0.0681, 0.0297, 0], [0.209, -0.279, 0.768])
+
+def system(n):
+	'''Well-conditioned, nonsymmetric n-by-n test matrix'''
+	return Matrix([[(n if i == j else 0) + 1/(1 + i + 2*j) for j in range(n)] for i in range(n)])
+
+def cases(sizes=(3, 5, 8, 12, 20), grid=((10, 50), (20, 200), (50, 500))):
+	'''Benchmarked hot paths as a dict of name to zero-argument callable'''
+	import numpy as np
+
+	out = {}
+
+	for n in sizes:
+		A = system(n)
+		b = Vector(linspace(0, 1, n))
+		out['Matrix.solve[%d]' % n] = lambda A=A, b=b: A.solve(b)
+		out['Matrix.det[%d]' % n] = lambda A=A: A.det()
+
+	for n in (3, 5, 9):
+		x = linspace(0, 1, n)
+		y = [xi**2 - xi for xi in x]
+		f = interp(x, y)
+		t = np.linspace(0, 1, 1000)
+		out['interp[%d]' % n] = lambda x=x, y=y: interp(x, y)
+		out['interp.eval[%d]' % n] = lambda f=f, t=t: f(t)
+
+	# Uncached variants, so results reflect computation rather than cache hits
+	out['NACA4m.coeffs'] = lambda: NACA4m._coeffs(0.12, 0.3)
+	sec = NACA4m(0.2, 0.05, 0.4, 0.12, 0.3)
+	out['Section.centroid'] = lambda: sec._centroid_adapt(1e-9, 128)
+
+	blade = bamberger()
+
+	def uncached():
+		'''Drops every section, coefficient and per-blade cache'''
+		NACA4m.cache.clear()
+		NACA4m.coeffs_cache.clear()
+		for layer in blade.memo.values():
+			layer.clear()
+
+	for num_secs, num_pts in grid:
+		def gen(num_secs=num_secs, num_pts=num_pts):
+			uncached()
+			return blade.gen(num_secs, num_pts)
+
+		def gen_arr(num_secs=num_secs, num_pts=num_pts):
+			uncached()
+			return blade.gen_arr(num_secs, num_pts)
+
+		out['Bamberger.gen[%d,%d]' % (num_secs, num_pts)] = gen
+		out['Bamberger.gen_arr[%d,%d]' % (num_secs, num_pts)] = gen_arr
+
+	# Forward-mode gradients over all 26 inputs, against the 27 uncached gen() calls of forward differences
+	def gen_grad():
+		uncached()
+		return blade.gen_grad(20, 100)
+
+	def gen_fd():
+		for it in range(27):
+			uncached()
+			out = blade.gen(20, 100)
+		return out
+
+	out['Bamberger.gen_grad[20,100]'] = gen_grad
+	out['Bamberger.gen[20,100]x27'] = gen_fd
+
+	return out
+
+def measure(fn, repeat=5):
+	'''Median wall time per call, peak traced memory in bytes, and number of memory blocks allocated by fn() and still held by its result
+
+	Python keeps no running count of allocations, so 'retained' counts the blocks left behind rather than every block allocated on the way.
+	'''
+	time = best_of(fn, repeat)
+
+	tracemalloc.start()
+	out = fn()
+	peak = tracemalloc.get_traced_memory()[1]
+	snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+	tracemalloc.stop()
+	del out
+
+	return {'time': time, 'peak': peak, 'retained': sum([stat.count for stat in snapshot.statistics('filename')])}
+
+def run(names=None, repeat=5):
+	'''Measurements for every case, or those whose names contain any of names'''
+	out = {}
+	for name, fn in sorted(cases().items()):
+		if names is None or any([it in name for it in names]):
+			out[name] = measure(fn, repeat)
+	return out
+
+def regressions(results, baseline, threshold=0.25):
+	'''Cases whose time, peak memory or retained block count exceeds baseline by more than threshold, as list of (name, key, baseline, result)'''
+	out = []
+	for name, res in sorted(results.items()):
+		for key in ('time', 'peak', 'retained'):
+			if name in baseline and key in baseline[name] and res[key] > (1 + threshold)*baseline[name][key]:
+				out.append((name, key, baseline[name][key], res[key]))
+	return out
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description='Benchmark blade_gen hot paths against a JSON baseline')
+	parser.add_argument('names', nargs='*', help='only run cases whose names contain one of these')
+	parser.add_argument('--baseline', default='bench.json', help='JSON baseline to compare against (default: bench.json)')
+	parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown, memory or retained-block growth counted as a regression (default: 0.25)')
+	parser.add_argument('--repeat', type=int, default=5, help='timed runs per case, of at least 0.2 s each, whose median is reported (default: 5)')
+	parser.add_argument('--update', action='store_true', help='write results to the baseline instead of comparing')
+	parser.add_argument('--compile', action='store_true', help='compare tree-walking and compiled Function evaluation instead')
+	args = parser.parse_args()
+
+	if args.compile:
+		for depth in (2, 4, 6, 8, 10):
+			print(bench_compile(depth))
+		sys.exit(0)
+
+	results = run(args.names or None, args.repeat)
+	for name, res in sorted(results.items()):
+		print('%-28s %10.3f ms %12d B peak %8d blocks retained' % (name, 1e3*res['time'], res['peak'], res['retained']))
+
+	if args.update:
+		try:
+			with open(args.baseline) as f:
+				baseline = json.load(f)
+		except IOError:
+			baseline = {}
+		baseline.update(results)
+		with open(args.baseline, 'w') as f:
+			json.dump(baseline, f, indent=1, sort_keys=True)
+		print('Baseline written to ' + args.baseline)
+	else:
+		with open(args.baseline) as f:
+			found = regressions(results, json.load(f), args.threshold)
+		for name, key, base, res in found:
+			print('REGRESSION %s %s: %.4g -> %.4g' % (name, key, base, res))
+		sys.exit(1 if found else 0)
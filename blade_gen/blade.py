@@ -1,9 +1,16 @@
 from __future__ import division
 
-from math import sqrt, atan, sin, cos, tan
+from collections import OrderedDict
 
-from linalg import Matrix, Vector
-from helper import linspace, interp
+from dual import Dual, sqrt, atan, sin, cos, tan, is_dual, value, gradient, seed, solve
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+from helper import linspace, interp, gauss_legendre, LRUCache
+from instrument import stage
 
 class Blade(object):
 	'''Base class for blade geometry implementations'''
@@ -15,42 +22,106 @@ class Blade(object):
 
 		self.flow_coeff = flow_coeff
 
+def _widen(x):
+	'''Dual x over a section's five parameters as a Dual over the nine station values of Bamberger.gen_grad()'''
+	return Dual(x.val, (0.0,)*4 + tuple(x.grad))
+
+def _chain(grad, jac):
+	'''Gradient over the design variables of a value whose gradient over some intermediates is grad, given jac, the gradients of those intermediates as rows'''
+	if np is not None:
+		return np.dot(grad, jac)
+	return tuple([sum([gi*row[j] for gi, row in zip(grad, jac) if gi != 0]) for j in range(len(jac[0]))])
+
 class Bamberger(Blade):
 	'''Blade parameterized by NACA modified 4-digit airfoil parameters per Bamberger 2015 (https://www.mb.uni-siegen.de/iftsm/forschung/veroeffentlichungen_pdf/139_2015.pdf)'''
 
-	def __init__(self, d, hub_ratio, flow_coeff, cd_in, k_in, tk_in, a_in, ta_in, aoa_in, sweep_in):
-		'''Imports geometric parameter interpolants and delegates to Blade.__init__'''
+	# Derived layers each input invalidates: 'stations' holds radii, twist and sweep offsets (see stations()), 'sections' the
+	# sections and their centroids at given stations. Evaluating and placing profiles is never cached, so neither layer
+	# grows with the number of points generated.
+	depends = {'d': ('stations', 'sections'), 'hub_ratio': ('stations', 'sections'), 'flow_coeff': ('stations',),
+	           'cd_in': ('sections',), 'k_in': ('sections',), 'tk_in': ('sections',), 'a_in': ('sections',), 'ta_in': ('sections',),
+	           'aoa_in': ('stations',), 'sweep_in': ('stations',)}
+
+	def __init__(self, d, hub_ratio, flow_coeff, cd_in, k_in, tk_in, a_in, ta_in, aoa_in, sweep_in, forms=None):
+		'''Imports geometric parameter interpolants and delegates to Blade.__init__
+
+		forms maps input list names (e.g. 'aoa_in') to the helper.interp form spreading them between hub and tip, given as a name or as ('clamped', (first, last)) with end slopes; unnamed lists use the global polynomial. Splines ('natural', 'clamped', 'pchip') avoid the ringing of high-degree polynomials through many control stations.
+		'''
 		super(Bamberger, self).__init__(d, hub_ratio, flow_coeff)
 
-		cd = interp(linspace(self.rh, self.rt, len(cd_in)), cd_in)
-		self.c = lambda r, cd=cd: 2*r*cd(r)
+		self.forms = dict(forms or {})
 
-		self.k = interp(linspace(self.rh, self.rt, len(k_in)), k_in)
-		self.tk = interp(linspace(self.rh, self.rt, len(tk_in)), tk_in)
-		self.a = interp(linspace(self.rh, self.rt, len(a_in)), a_in)
-		self.ta = interp(linspace(self.rh, self.rt, len(ta_in)), ta_in)
+		self.inputs = OrderedDict([('d', d), ('hub_ratio', hub_ratio), ('flow_coeff', flow_coeff), ('cd_in', cd_in), ('k_in', k_in), ('tk_in', tk_in), ('a_in', a_in), ('ta_in', ta_in), ('aoa_in', aoa_in), ('sweep_in', sweep_in)])
+		self.memo = {'stations': LRUCache(8), 'sections': LRUCache(8)}
 
-		self.aoa = interp(linspace(self.rh, self.rt, len(aoa_in)), aoa_in)
-		self.sweep = interp(linspace(self.rh, self.rt, len(sweep_in)), sweep_in)
+		self._build(list(self.inputs))
 
-	def gen(self, num_secs, num_pts, f=lambda t: t):  # TO-DO: rename num_pts to indicate parametricity
-		'''Generate points for num_pts parameters in [0,1] at each of num_secs spanwise stations between hub and tip'''
-		az0 = 0
-		z0 = 0
+	def set(self, **kwargs):
+		'''Replaces the named inputs of __init__, rebuilding only their interpolants and dropping only the derived layers that depend on them'''
+		assert all([key in self.inputs for key in kwargs]), 'Unknown Bamberger input'
 
-		dr = (self.rt - self.rh)/num_secs
+		self.inputs.update(kwargs)
+		self._build(list(kwargs))
+
+		for layer in set([layer for key in kwargs for layer in Bamberger.depends[key]]):
+			self.memo[layer].clear()
+
+	def _build(self, keys):
+		'''Recomputes the radii and interpolants derived from the inputs named in keys'''
+		inputs = self.inputs
+
+		if 'd' in keys or 'hub_ratio' in keys:
+			Blade.__init__(self, inputs['d'], inputs['hub_ratio'], inputs['flow_coeff'])
+			keys = list(inputs)
+		self.flow_coeff = inputs['flow_coeff']
 
-		pts = {'upper': [[None]*num_pts]*num_secs, 'lower': [[None]*num_pts]*num_secs}
+		def spread(key):
+			'''Interpolant of input list key over evenly-spaced radii from hub to tip in the form selected by self.forms'''
+			form = self.forms.get(key, 'power')
+			form, slopes = (form, None) if isinstance(form, str) else form
+			return interp(linspace(self.rh, self.rt, len(inputs[key])), inputs[key], form, slopes)
+
+		if 'cd_in' in keys:
+			cd = spread('cd_in')
+			self.c = lambda r, cd=cd: 2*r*cd(r)
+
+		for name in ('k', 'tk', 'a', 'ta', 'aoa', 'sweep'):
+			if name + '_in' in keys:
+				setattr(self, name, spread(name + '_in'))
+
+	def gen(self, num_secs, num_pts, f=lambda t: t):  # TO-DO: rename num_pts to indicate parametricity
+		'''Generate points for num_pts parameters in [0,1] at each of num_secs spanwise stations between hub and tip'''
+		pts = {'upper': [[None]*num_pts for i in range(num_secs)], 'lower': [[None]*num_pts for i in range(num_secs)]}
 
-		args = map(f, linspace(0, 1, num_pts))
+		args = list(map(f, linspace(0, 1, num_pts)))
 
 		assert all([curr > prev for curr, prev in zip(args[1:], args[:-1])]), 'f(t) must increase monotonically on [0,1]'
 
+		# Sections and centroids only depend on the section inputs, so sweep and angle-of-attack edits keep them. Profiles
+		# are evaluated afresh, so the cache does not hold a copy of every generated blade.
+		secs = self.memo['sections'].get(('gen', num_secs), lambda: self._sections(num_secs))
+
 		'''
 		Later on, these points will be used to generate upper and lower surfaces for the blade. These surfaces need to extend slightly within the hub solid to ensure that a well-defined edge can be created at the root of each blade. Therefore, sections are generated beginning at 99% of the desired hub radius. This allows the final geometry to have exactly the size that the end-user expects without creating a perceptible difference in the blade topology or increasing the memory usage of this array, which already holds 3*num_secs*num_pts floating-point numbers, roughly 26 kiB.
 		'''
 
-		for i, r in enumerate(linspace(0.99*self.rh, self.rt, num_secs)):
+		for i, ((r, twist, az0, z0), (sec, (u0, w0))) in enumerate(zip(self._walk(num_secs), secs)):
+			for (key, lol) in pts.items():
+				with stage('profile'):
+					local = [(u - u0, w - w0) for u, w in map(sec.profile[key], args)]
+				with stage('transform'):
+					lol[i] = self._placed(r, twist, az0, z0, local)
+
+		return pts
+
+	def _walk(self, num_secs):
+		'''Radius, twist and cumulative sweep offsets (az0, z0) of each of gen()'s num_secs stations, one station at a time'''
+		az0 = 0
+		z0 = 0
+
+		dr = (self.rt - self.rh)/num_secs
+
+		for r in linspace(0.99*self.rh, self.rt, num_secs):
 			sweep = self.sweep(r)
 			aoa = self.aoa(r)
 
@@ -60,60 +131,301 @@ class Bamberger(Blade):
 			az0 += turn*cos(twist)/r
 			z0 += turn*sin(twist)
 
-			curves = self.sec(r).profile
+			yield r, twist, az0, z0
 
-			orig = self.sec(r).centroid()
-			shift = lambda pos: tuple([x - x0 for x, x0 in zip(pos, orig)])
+	@staticmethod
+	def _placed(r, twist, az0, z0, uw):
+		'''Points (x, y, z) of the section-local (u, w) in uw at radius r, placed per twist, az0 and z0'''
+		ct = cos(twist)
+		st = sin(twist)
 
-			for (key, lol) in pts.items():
-				az = lambda u, w: az0 - (u*cos(twist) + w*sin(twist))/r
-				z = lambda u, w: z0 - u*sin(twist) + w*cos(twist)
+		out = []
+		for u, w in uw:
+			az = az0 - (u*ct + w*st)/r
+			out.append((r*cos(az), r*sin(az), z0 - u*st + w*ct))
+		return out
 
-				x = lambda u, w: r*cos(az(u, w))
-				y = lambda u, w: r*sin(az(u, w))
+	def _sections(self, num_secs):
+		'''Section and its centroid (u0, w0) at each of gen()'s num_secs stations'''
+		return [(sec, sec.centroid()) for sec in map(self.sec, linspace(0.99*self.rh, self.rt, num_secs))]
 
-				lol[i] = [(x(u, w), y(u, w), z(u, w)) for u, w in map(shift, map(curves[key], args))]
+	def gen_grad(self, num_secs, num_pts, f=lambda t: t, wrt=None):
+		'''gen() with the gradient of every point coordinate over the design variables (every entry of the inputs of __init__, or of those named in wrt), chained through the nine values of each station, as (pts, grads, names)'''
+		wrt = list(self.inputs) if wrt is None else list(wrt)
 
-		return pts
+		sizes = [len(self.inputs[key]) if hasattr(self.inputs[key], '__len__') else 0 for key in wrt]
+		names = [key + '[' + str(i) + ']' if size else key for key, size in zip(wrt, sizes) for i in range(max(size, 1))]
+
+		args = dict(self.inputs)
+		offset = 0
+		for key, size in zip(wrt, sizes):
+			vals = seed(self.inputs[key] if size else [self.inputs[key]], offset, len(names))
+			args[key] = vals if size else vals[0]
+			offset += max(size, 1)
+
+		blade = Bamberger(forms=self.forms, **args)
+		params = list(map(f, linspace(0, 1, num_pts)))
+
+		vals = {'upper': [None]*num_secs, 'lower': [None]*num_secs}
+		grads = {'upper': [None]*num_secs, 'lower': [None]*num_secs}
+
+		for i, (r, twist, az0, z0) in enumerate(blade._walk(num_secs)):
+			outer = [r, twist, az0, z0, blade.c(r), blade.k(r), blade.tk(r), blade.a(r), blade.ta(r)]
+			jac = [gradient(it, len(names)) for it in outer]
+			jac = np.array(jac) if np is not None else jac
+
+			# Sections are differentiated against their own five parameters and widened to all nine only for placement
+			place = seed([value(it) for it in outer[:4]], 0, 9)
+			sec = NACA4m.cached(*seed([value(it) for it in outer[4:]]))
+			u0, w0 = sec.centroid()
+
+			for key, curve in sec.profile.items():
+				pts = self._placed(place[0], place[1], place[2], place[3], [(_widen(u - u0), _widen(w - w0)) for u, w in map(curve, params)])
+
+				vals[key][i] = [tuple([value(x) for x in pt]) for pt in pts]
+				grads[key][i] = [tuple([_chain(gradient(x, 9), jac) for x in pt]) for pt in pts]
+
+		return vals, grads, names
+
+	def gen_arr(self, num_secs, num_pts, f=lambda t: t, out=None):
+		'''Array-backed gen(): fills a contiguous float64 array of shape (2, num_secs, num_pts, 3) indexed as [surface (0 upper, 1 lower), section, point, xyz]
+
+		The result supports the buffer protocol (e.g. memoryview(pts)), so it can be handed to CAD and mesh code without copying. Pass out to reuse a preallocated array.
+		'''
+		assert np is not None, 'Array-backed generation requires NumPy'
+
+		if out is None:
+			out = np.empty((2, num_secs, num_pts, 3))
+		else:
+			assert out.shape == (2, num_secs, num_pts, 3) and out.dtype == np.float64 and out.flags.c_contiguous, 'out must be a C-contiguous float64 array of shape (2, num_secs, num_pts, 3)'
+
+		args = self._args(num_pts, f)
+		r, twist, az0, z0 = self.stations(num_secs)
+
+		secs = self.memo['sections'].get(('arr', num_secs), lambda: self._sections_arr(r))
+
+		return self._transform(self._local(out, args, *secs), r, twist, az0, z0)
+
+	def gen_iter(self, num_secs, num_pts, f=lambda t: t, block=1):
+		'''Streaming gen_arr(): yields consecutive (2, n, num_pts, 3) slabs of at most block sections, so memory does not grow with num_secs'''
+		assert np is not None, 'Array-backed generation requires NumPy'
+
+		args = self._args(num_pts, f)
+		r, twist, az0, z0 = self.stations(num_secs)
+
+		for i in range(0, num_secs, block):
+			j = min(i + block, num_secs)
+			yield self._place(np.empty((2, j - i, num_pts, 3)), args, r[i:j], twist[i:j], az0[i:j], z0[i:j])
+
+	def _args(self, num_pts, f):
+		'''Chordwise section parameters f(t) at num_pts evenly-spaced t as NumPy array'''
+		args = np.array([f(t) for t in linspace(0, 1, num_pts)], dtype=float)
+
+		assert np.all(np.diff(args) > 0), 'f(t) must increase monotonically on [0,1]'
+
+		return args
+
+	def stations(self, num_secs):
+		'''Radius, twist and cumulative sweep offsets (az0, z0) of each of num_secs stations as NumPy arrays, kept until a station input changes'''
+		return self.memo['stations'].get(num_secs, lambda: self._stations(num_secs))
+
+	def _stations(self, num_secs):
+		'''Uncached Bamberger.stations()'''
+		# See gen() for why sections start at 99% of the hub radius
+		r = np.array(linspace(0.99*self.rh, self.rt, num_secs))
+		dr = (self.rt - self.rh)/num_secs
+
+		twist = self._twist(r)
+		turn = np.tan(self.sweep(r))*dr
+
+		az0 = np.cumsum(turn*np.cos(twist)/r)
+		z0 = np.cumsum(turn*np.sin(twist))
+
+		return r, twist, az0, z0
+
+	def _twist(self, r):
+		'''Section twist at radius r as angle of attack plus inflow angle'''
+		return self.aoa(r) + np.arctan(self.flow_coeff*self.rt/(r*(1 - (self.rh/self.rt)**2)))
+
+	def gen_adapt(self, tol, max_secs=200, max_pts=2000):
+		'''Smallest grid found by refinement whose surfaces deviate from the blade by at most the chord height tol, as (pts, r, t)
+
+		Starting from 3 stations and 9 chordwise parameters, each pass inserts the midpoint of every parameter interval whose midpoint lies more than tol from the chord between its neighbours on any station and surface, and likewise the midpoint of every station interval whose mid-radius section lies more than tol from the straight-line interpolation between its neighbours. Refinement stops when no interval exceeds tol or when num_secs and num_pts would exceed max_secs and max_pts, in which case the worst intervals are refined first. Sweep offsets at arbitrary radii are interpolated from gen_arr(max_secs, ...), which the result matches at common stations. pts has the layout of gen_arr(); r and t are the chosen station radii and section parameters.
+		'''
+		assert np is not None, 'Adaptive generation requires NumPy'
+
+		ref = self.stations(max_secs)
+
+		def at(r, t):
+			'''Placed points at stations r and section parameters t'''
+			az0 = np.interp(r, ref[0], ref[2])
+			z0 = np.interp(r, ref[0], ref[3])
+			return self._place(np.empty((2, len(r), len(t), 3)), t, r, self._twist(r), az0, z0)
+
+		def height(p, a, b):
+			'''Distance from points p to the segments between points a and b, maximized over all but the last grid axis'''
+			d = b - a
+			s = np.clip(np.sum((p - a)*d, axis=-1)/np.maximum(np.sum(d*d, axis=-1), 1e-300), 0, 1)
+			return np.linalg.norm(p - a - s[..., None]*d, axis=-1)
+
+		def refine(x, err, room):
+			'''x with the midpoints of the (at most room) worst intervals exceeding tol inserted'''
+			worst = np.array([i for i in np.argsort(-err) if err[i] > tol][:max(room, 0)], dtype=int)
+			return np.sort(np.concatenate([x, 0.5*(x[worst] + x[worst + 1])])), len(worst)
+
+		r = ref[0][[0, max_secs//2, -1]] if max_secs > 2 else ref[0]
+		t = np.array(linspace(0, 1, 9))
+
+		while True:
+			tm = np.sort(np.concatenate([t, 0.5*(t[:-1] + t[1:])]))
+
+			pts = at(r, tm)
+			err_t = height(pts[:, :, 1::2], pts[:, :, :-1:2], pts[:, :, 2::2]).max(axis=(0, 1))
+
+			pts = pts[:, :, ::2]
+			mid = at(0.5*(r[:-1] + r[1:]), t)
+			err_r = height(mid, pts[:, :-1], pts[:, 1:]).max(axis=(0, 2))
+
+			t, num_t = refine(t, err_t, max_pts - len(t))
+			r, num_r = refine(r, err_r, max_secs - len(r))
+
+			if num_t == 0 and num_r == 0:
+				return pts, r, t
+
+	def _place(self, out, args, r, twist, az0, z0):
+		'''Fills out[:, i] with the section at r[i] evaluated at args, centred on its centroid and placed per twist[i], az0[i] and z0[i]'''
+		# Section-local (u, w) about each centroid, written into the x and y slots before the transform overwrites them
+		return self._transform(self._local(out, args, *self._sections_arr(r)), r, twist, az0, z0)
+
+	def _sections_arr(self, r):
+		'''Sections at every radius in NumPy array r with their centroids as (len(r), 2) array'''
+		secs = self.secs(r)
+		return secs, NACA4m.centroids(secs)
+
+	def _local(self, out, args, secs, orig):
+		'''Fills out[..., 0] and out[..., 1] with the section-local (u, w) about each centroid orig of secs evaluated at args'''
+
+		with stage('profile'):
+			for i, (sec, (u0, w0)) in enumerate(zip(secs, orig)):
+				for j, (u, w) in enumerate((sec.bounds_arr(args)[key] for key in ('upper', 'lower'))):
+					out[j, i, :, 0] = u - u0
+					out[j, i, :, 1] = w - w0
+
+		return out
+
+	def _transform(self, out, r, twist, az0, z0):
+		'''Overwrites the section-local (u, w) in out[..., :2] with points placed per twist, az0 and z0 at radii r'''
+		with stage('transform'):
+			u = out[..., 0]
+			w = out[..., 1]
+
+			ct = np.cos(twist)[:, None]
+			st = np.sin(twist)[:, None]
+			r = r[:, None]
+
+			az = az0[:, None] - (u*ct + w*st)/r
+			out[..., 2] = z0[:, None] - u*st + w*ct
+			np.multiply(r, np.cos(az), out=out[..., 0])
+			np.multiply(r, np.sin(az), out=out[..., 1])
+
+		return out
 
 	def sec(self, r):
 		'''Interpolates geometric parameters and returns evenly-spaced profiles'''
-		return NACA4m(self.c(r), self.k(r), self.tk(r), self.a(r), self.ta(r))
+		with stage('sec'):
+			return NACA4m.cached(self.c(r), self.k(r), self.tk(r), self.a(r), self.ta(r))
+
+	def secs(self, r):
+		'''Sections at every radius in NumPy array r, interpolating each geometric parameter in one vectorized call'''
+		with stage('sec'):
+			return [NACA4m.cached(*it) for it in zip(*[f(r).tolist() for f in (self.c, self.k, self.tk, self.a, self.ta)])]
 
 class Section(object):
 	'''Base class for section geometry implementations'''
 
 	def __init__(self, c):
-		'''Initializes base Section with child-defined boundary functions'''
+		'''Initializes base Section with child-defined boundary functions and their parametric derivatives'''
 		self.c = c
 		self.profile = self.bounds()
+		self.dprofile = self.dbounds()
+
+		self.centroid_memo = {}
 
 	def qc(self):
 		'''Section quarter-chord for spanwise positioning'''
 		return 0.25*self.c
 
-	def centroid(self, num_t=101, step=1e-4):  # TO-DO: improve efficiency via higher-order computation
-		'''Compute numerical centroid of general section'''
-		usum = 0
-		wsum = 0
+	def breaks(self):
+		'''Parameters in (0,1) where child-defined boundary functions switch branches'''
+		return []
+
+	def centroid(self, tol=1e-9, max_order=128):
+		'''Area centroid of general section, raising the quadrature order until the result moves less than tol*self.c'''
+		with stage('centroid'):
+			if (tol, max_order) not in self.centroid_memo:
+				self.centroid_memo[tol, max_order] = self._centroid_adapt(tol, max_order)
+			return self.centroid_memo[tol, max_order]
+
+	def _centroid_adapt(self, tol, max_order):
+		'''Uncached Section.centroid()'''
+		prev = self._centroid(8)
 
-		count = 0
+		n = 16
+		while n <= max_order:
+			curr = self._centroid(n)
+			if max([abs(it - it0) for it, it0 in zip(curr, prev)]) < tol*self.c:
+				return curr
 
-		for i, ((utop, wtop), (ubot, wbot)) in enumerate(zip(*[map(curve, linspace(0, 1, num_t)) for curve in self.profile.values()])):
-			dist = sqrt((ubot - utop)**2 + (wbot - wtop)**2)
+			prev = curr
+			n *= 2
 
-			num_steps = int(dist/step)
+		return prev
 
-			usum += sum(linspace(utop, ubot, num_steps))
-			wsum += sum(linspace(wtop, wbot, num_steps))
+	def _centroid(self, n):
+		'''Area centroid by Green's theorem with n-point Gauss-Legendre quadrature on each smooth boundary segment'''
+		nodes, weights = gauss_legendre(n)
 
-			count += num_steps
+		# Integrate in s = sqrt(t) so the sqrt(t) leading-edge behaviour of thickness is smooth for the quadrature
+		brks = sorted(set([0, 1] + [sqrt(t) for t in self.breaks() if 0 < t < 1]))
 
-		return (usum/count, wsum/count)
+		area = 0
+		mu = 0
+		mw = 0
+
+		# Counterclockwise boundary: lower surface forward, upper surface backward
+		for lo, hi in zip(brks[:-1], brks[1:]):
+			for x, wt in zip(nodes, weights):
+				s = lo + 0.5*(hi - lo)*(x + 1)
+				jac = (hi - lo)*wt*s
+
+				for key, sign in (('lower', 1), ('upper', -1)):
+					u, w = self.profile[key](s*s)
+					du, dw = self.dprofile[key](s*s)
+
+					area += sign*jac*u*dw
+					mu += sign*jac*0.5*u*u*dw
+					mw -= sign*jac*0.5*w*w*du
+
+		# Straight trailing-edge closure from lower to upper surface
+		(u1, w1), (u2, w2) = self.profile['lower'](1), self.profile['upper'](1)
+
+		area += (w2 - w1)*(u1 + u2)/2
+		mu += (w2 - w1)*(u1*u1 + u1*u2 + u2*u2)/6
+		mw -= (u2 - u1)*(w1*w1 + w1*w2 + w2*w2)/6
+
+		return (mu/area, mw/area)
 
 class NACA4m(Section):
 	'''Section implementation for 4-digit modified NACA airfoil'''
 
+	# Sections and thickness coefficients keyed on parameters rounded to places decimal places
+	places = 12
+	cache = LRUCache(1024)
+	coeffs_cache = LRUCache(1024)
+
+	# Abbott 1959, p. 117: ratio of aft linear coefficient to max thickness against position of max thickness
+	d1_ratio = interp(linspace(0.2, 0.6, 5), [1, 1.17, 1.575, 2.325, 3.5])
+
 	def __init__(self, c, k, tk, a, ta):
 		'''Imports geometric parameters and delegates to Section.__init__'''
 		self.k = k
@@ -122,6 +434,8 @@ class NACA4m(Section):
 		self.a = a
 		self.ta = ta
 
+		self.thick = NACA4m.coeffs(a, ta)
+
 		super(NACA4m, self).__init__(c)
 
 	def bounds(self):
@@ -140,7 +454,7 @@ class NACA4m(Section):
 			else:
 				return 2*self.k/(1 - self.tk)**2 * (self.tk - t)
 
-		coeffs = NACA4m.coeffs(self.a, self.ta)
+		coeffs = self.thick
 
 		def h(t):
 			if t < self.ta:
@@ -150,29 +464,188 @@ class NACA4m(Section):
 
 		return {'upper': lambda t: (uc(t) - h(t)*sin(atan(m(t))), wc(t) + h(t)*cos(atan(m(t)))), 'lower': lambda t: (uc(t) + h(t)*sin(atan(m(t))), wc(t) - h(t)*cos(atan(m(t))))}
 
+	def dbounds(self):
+		'''Returns parametric derivatives of the functions returned by self.bounds()'''
+		a0, a1, a2, a3, d0, d1, d2, d3 = self.thick
+
+		def m(t):
+			if t < self.tk:
+				return 2*self.k/self.tk**2 * (self.tk - t)
+			else:
+				return 2*self.k/(1 - self.tk)**2 * (self.tk - t)
+
+		def dm(t):
+			return -2*self.k/self.tk**2 if t < self.tk else -2*self.k/(1 - self.tk)**2
+
+		def h(t):
+			if t < self.ta:
+				return self.c*(a0*sqrt(t) + a1*t + a2*t**2 + a3*t**3)
+			else:
+				return self.c*(d0 + d1*(1-t) + d2*(1-t)**2 + d3*(1-t)**3)
+
+		def dh(t):
+			if t < self.ta:
+				return self.c*(0.5*a0/sqrt(t) + a1 + 2*a2*t + 3*a3*t**2)
+			else:
+				return -self.c*(d1 + 2*d2*(1-t) + 3*d3*(1-t)**2)
+
+		def offset(t):
+			'''Derivative of the thickness offset h*(-sin(atan(m)), cos(atan(m))) from the camber line'''
+			th = atan(m(t))
+			dth = dm(t)/(1 + m(t)**2)
+			return (-dh(t)*sin(th) - h(t)*cos(th)*dth, dh(t)*cos(th) - h(t)*sin(th)*dth)
+
+		def upper(t):
+			du, dw = offset(t)
+			return (self.c + du, self.c*m(t) + dw)
+
+		def lower(t):
+			du, dw = offset(t)
+			return (self.c - du, self.c*m(t) - dw)
+
+		return {'upper': upper, 'lower': lower}
+
+	def breaks(self):
+		'''Camber and thickness branch points'''
+		return [self.tk, self.ta]
+
+	def bounds_arr(self, t):
+		'''Evaluates self.bounds() over the whole parameter array t, returning contiguous (u, w) arrays per surface'''
+		assert np is not None, 'Array evaluation of sections requires NumPy'
+
+		pts = NACA4m._arr(np.asarray(t, dtype=float), self.c, self.k, self.tk, self.ta, self.thick)
+		return dict([(key, tuple(map(np.ascontiguousarray, uw))) for key, uw in pts.items()])
+
+	@staticmethod
+	def _arr(t, c, k, tk, ta, thick, deriv=False):
+		'''Broadcast evaluation of NACA4m surfaces (and optionally their t-derivatives) where parameters may be scalars or arrays'''
+		a0, a1, a2, a3, d0, d1, d2, d3 = thick
+
+		# At tk of 0 or 1 one branch divides by zero, and np.where discards it
+		fore = t < tk
+		with np.errstate(divide='ignore', invalid='ignore'):
+			dm = np.where(fore, -2*k/tk**2, -2*k/(1 - tk)**2)
+			wc = c*np.where(fore, k*(2*tk*t - t**2)/tk**2, k*(1 - 2*tk + 2*tk*t - t**2)/(1 - tk)**2)
+		m = dm*(t - tk)
+
+		s = 1 - t
+		h = c*np.where(t < ta, a0*np.sqrt(t) + t*(a1 + t*(a2 + t*a3)), d0 + s*(d1 + s*(d2 + s*d3)))
+
+		# sin(atan(m)) and cos(atan(m)) without the trigonometric round trip
+		cs = 1/np.sqrt(1 + m**2)
+		sn = m*cs
+
+		uc = c*t
+
+		pts = {'upper': (uc - h*sn, wc + h*cs), 'lower': (uc + h*sn, wc - h*cs)}
+		if not deriv:
+			return pts
+
+		dh = c*np.where(t < ta, 0.5*a0/np.sqrt(t) + a1 + t*(2*a2 + 3*a3*t), -(d1 + s*(2*d2 + 3*d3*s)))
+		dth = dm*cs**2
+
+		du = dh*sn + h*cs*dth
+		dw = dh*cs - h*sn*dth
+
+		return pts, {'upper': (c - du, c*m + dw), 'lower': (c + du, c*m - dw)}
+
+	@staticmethod
+	def centroids(secs, tol=1e-9, max_order=128):
+		'''Vectorized Section.centroid() over a list of NACA4m sections, returned as an array of shape (len(secs), 2)'''
+		assert np is not None, 'Vectorized centroids require NumPy'
+
+		with stage('centroid'):
+			return NACA4m._centroids(secs, tol, max_order)
+
+	@staticmethod
+	def _centroids(secs, tol, max_order):
+		'''Uninstrumented NACA4m.centroids()'''
+
+		c, k, tk, ta = [np.array([getattr(sec, name) for sec in secs], dtype=float)[:, None] for name in ('c', 'k', 'tk', 'ta')]
+		thick = np.array([sec.thick for sec in secs], dtype=float).T[:, :, None]
+
+		brks = np.sort(np.hstack([np.zeros_like(tk), np.sqrt(np.clip(tk, 0, 1)), np.sqrt(np.clip(ta, 0, 1)), np.ones_like(tk)]), axis=1)
+		lo = brks[:, :-1, None]
+		hi = brks[:, 1:, None]
+
+		# Breaks at 0 or 1 (tk or ta of 0 or 1) leave zero-length panels, whose nodes are moved off the singular slope at s=0
+		empty = np.broadcast_to(hi <= lo, (len(secs), brks.shape[1] - 1, 1))
+
+		end = NACA4m._arr(np.ones_like(c), c, k, tk, ta, thick)
+		(u1, w1), (u2, w2) = end['lower'], end['upper']
+
+		def centroid(n):
+			nodes, weights = map(np.array, gauss_legendre(n))
+
+			s = np.where(empty, 0.5, lo + 0.5*(hi - lo)*(nodes + 1)).reshape(len(secs), -1)
+			jac = ((hi - lo)*weights).reshape(len(secs), -1)*s
+
+			pts, dpts = NACA4m._arr(s*s, c, k, tk, ta, thick, deriv=True)
+
+			area = (w2 - w1)*(u1 + u2)/2
+			mu = (w2 - w1)*(u1*u1 + u1*u2 + u2*u2)/6
+			mw = -(u2 - u1)*(w1*w1 + w1*w2 + w2*w2)/6
+
+			for key, sign in (('lower', 1), ('upper', -1)):
+				(u, w), (du, dw) = pts[key], dpts[key]
+
+				area = area + sign*np.sum(jac*u*dw, axis=1, keepdims=True)
+				mu = mu + sign*np.sum(jac*0.5*u*u*dw, axis=1, keepdims=True)
+				mw = mw - sign*np.sum(jac*0.5*w*w*du, axis=1, keepdims=True)
+
+			return np.hstack([mu/area, mw/area])
+
+		prev = centroid(8)
+
+		n = 16
+		while n <= max_order:
+			curr = centroid(n)
+			if np.all(np.abs(curr - prev) < tol*c):
+				return curr
+
+			prev = curr
+			n *= 2
+
+		return prev
+
+	@classmethod
+	def cached(cls, c, k, tk, a, ta):
+		'''Memoized constructor returning a shared section for repeated parameters'''
+		if any([is_dual(it) for it in (c, k, tk, a, ta)]):
+			return cls(c, k, tk, a, ta)  # Sensitivities are specific to one seeding, so Dual sections are never shared
+
+		key = tuple([round(it, cls.places) for it in (c, k, tk, a, ta)])
+		return cls.cache.get(key, lambda: cls(c, k, tk, a, ta))
+
 	@staticmethod
 	def coeffs(a, ta):
 		'''Coefficients of piecewise-quadratic thickness distribution from geometric parameters per Abbott 1959, p. 117 (https://aeroknowledge77.files.wordpress.com/2011/09/58986488-theory-of-wing-sections-including-a-summary-of-airfoil-data.pdf)'''
+		if is_dual(a) or is_dual(ta):
+			return list(NACA4m._coeffs(a, ta))
+
+		key = (round(a, NACA4m.places), round(ta, NACA4m.places))
+		with stage('coeffs'):
+			return list(NACA4m.coeffs_cache.get(key, lambda: NACA4m._coeffs(a, ta)))
+
+	@staticmethod
+	def _coeffs(a, ta):
+		'''Uncached NACA4m.coeffs()'''
 		a0 = sqrt(2.2038)*a
 		d0 = 0.01*a
 
 		d1 = NACA4m.d1(a, ta)
 
-		sys = Matrix([[ta, ta**2, ta**3, 0, 0],
-		             [0, 0, 0, (1-ta)**2, (1-ta)**3],
-		             [1, 2*ta, 3*ta**2, 0, 0],
-		             [0, 0, 0, 2*(1-ta), 3*(1-ta)**2],
-		             [0, 2, 6*ta, -2, 6*(1-ta)]])
-		rhs = Vector([a-sqrt(ta)*a0, a-d0-(1-ta)*d1, -0.5*a0/sqrt(ta), -d1, 0.25*a0/sqrt(ta**3)])
-		a1, a2, a3, d2, d3 = sys.solve(rhs)
+		sys = [[ta, ta**2, ta**3, 0, 0],
+		       [0, 0, 0, (1-ta)**2, (1-ta)**3],
+		       [1, 2*ta, 3*ta**2, 0, 0],
+		       [0, 0, 0, 2*(1-ta), 3*(1-ta)**2],
+		       [0, 2, 6*ta, -2, 6*(1-ta)]]
+		rhs = [a-sqrt(ta)*a0, a-d0-(1-ta)*d1, -0.5*a0/sqrt(ta), -d1, 0.25*a0/sqrt(ta**3)]
+		a1, a2, a3, d2, d3 = solve(sys, rhs)
 
-		return [a0, a1, a2, a3, d0, d1, d2, d3]
+		return (a0, a1, a2, a3, d0, d1, d2, d3)
 
 	@staticmethod
 	def d1(a, ta):
 		'''Aft linear coefficient by interpolation between known values per Abbott 1959, p. 117'''
-		ta_th = linspace(0.2, 0.6, 5)
-		ratio_th = [1, 1.17, 1.575, 2.325, 3.5]
-
-		f = interp(ta_th, ratio_th)
-		return a*f(ta)
+		return a*NACA4m.d1_ratio(ta)
@@ -0,0 +1,169 @@
+from __future__ import division
+
+import numpy as np
+
+from helper import linspace
+
+def knot_arr(deg, rank, f=lambda t: t, mults=None):
+	'''Clamped knot vector for rank control points of degree deg with knot values f(t) on t in [0,1], as in gen.knot_arr but flattened by multiplicity'''
+	ord = deg + 1
+	num = rank + ord
+
+	mults = [ord] + [1]*(num-2*ord) + [ord] if mults is None else mults
+	assert sum(mults) == num, 'Knot multiplicities must sum to rank + deg + 1'
+
+	vals = [f(t) for t in linspace(0, 1, len(mults))]
+
+	return np.repeat(np.array(vals, dtype=float), mults)
+
+def averaged_knots(deg, params):
+	'''Clamped knot vector by averaging deg consecutive interpolation parameters (Piegl & Tiller eq. 9.8)'''
+	n = len(params)
+	inner = [np.mean(params[j:j+deg]) for j in range(1, n - deg)]
+	return np.array([params[0]]*(deg + 1) + inner + [params[-1]]*(deg + 1), dtype=float)
+
+def greville(deg, knots):
+	'''Knot averages, which satisfy the Schoenberg-Whitney condition as interpolation parameters for knots'''
+	n = len(knots) - deg - 1
+	return np.array([np.mean(knots[i+1:i+deg+1]) for i in range(n)])
+
+def chord_params(pts, axis):
+	'''Chord-length parameters in [0,1] along axis of grid pts, averaged over the other grid direction'''
+	pts = np.moveaxis(pts, axis, 1)
+	d = np.linalg.norm(np.diff(pts, axis=1), axis=-1)
+	t = np.hstack([np.zeros((len(pts), 1)), np.cumsum(d, axis=1)])
+	t /= t[:, -1:]
+	out = t.mean(axis=0)
+	out[-1] = 1
+	return out
+
+def basis(deg, knots, x):
+	'''Knot span index and the deg+1 nonzero B-spline basis values at every x by the Cox-de Boor recurrence, vectorized over x'''
+	x = np.asarray(x, dtype=float)
+	n = len(knots) - deg - 1
+
+	span = np.clip(np.searchsorted(knots, x, side='right') - 1, deg, n - 1)
+
+	N = np.zeros(x.shape + (deg + 1,))
+	left = np.zeros_like(N)
+	right = np.zeros_like(N)
+
+	N[..., 0] = 1
+	for j in range(1, deg + 1):
+		left[..., j] = x - knots[span + 1 - j]
+		right[..., j] = knots[span + j] - x
+
+		saved = 0
+		for r in range(j):
+			temp = N[..., r]/(right[..., r+1] + left[..., j-r])
+			N[..., r] = saved + right[..., r+1]*temp
+			saved = left[..., j-r]*temp
+		N[..., j] = saved
+
+	return span, N
+
+def solve_banded(ab, rhs, p):
+	'''Solves the band system with ab[i, j-i+p] = A[i,j] for every column of rhs by elimination without pivoting, which is stable for totally positive B-spline collocation matrices'''
+	ab = np.array(ab, dtype=float)
+	x = np.array(rhs, dtype=float)
+	n = len(ab)
+
+	for k in range(n):
+		piv = ab[k, p]
+		for i in range(k+1, min(k+p+1, n)):
+			f = ab[i, k-i+p]/piv
+			if f != 0:
+				ab[i, k-i+p:k-i+2*p+1] -= f*ab[k, p:]
+				x[i] -= f*x[k]
+
+	for k in reversed(range(n)):
+		hi = min(k+p+1, n)
+		x[k] = (x[k] - np.tensordot(ab[k, p+1:p+1+hi-k-1], x[k+1:hi], axes=1))/ab[k, p]
+
+	return x
+
+def collocation(deg, knots, params):
+	'''Band storage of the interpolation matrix [N_j(params[i])] with lower and upper bandwidth deg'''
+	n = len(params)
+	span, N = basis(deg, knots, params)
+
+	ab = np.zeros((n, 2*deg + 1))
+	for i in range(n):
+		ab[i, span[i]-i:span[i]-i+deg+1] = N[i]
+
+	return ab
+
+class Surface(object):
+	'''Tensor-product B-spline surface with control net ctrl[v, u, xyz]'''
+
+	def __init__(self, deg_u, deg_v, knots_u, knots_v, ctrl):
+		'''Stores degrees as self.deg_u, self.deg_v, knot vectors as self.knots_u, self.knots_v and control net as self.ctrl'''
+		self.deg_u = deg_u
+		self.deg_v = deg_v
+
+		self.knots_u = np.asarray(knots_u, dtype=float)
+		self.knots_v = np.asarray(knots_v, dtype=float)
+
+		self.ctrl = np.asarray(ctrl, dtype=float)
+
+		assert self.ctrl.shape[:2] == (len(self.knots_v) - deg_v - 1, len(self.knots_u) - deg_u - 1), 'Control net does not match knot vectors'
+
+	def __call__(self, u, v):
+		'''Points on self at broadcast parameter arrays u and v'''
+		u, v = np.broadcast_arrays(np.asarray(u, dtype=float), np.asarray(v, dtype=float))
+
+		su, Nu = basis(self.deg_u, self.knots_u, u)
+		sv, Nv = basis(self.deg_v, self.knots_v, v)
+
+		out = np.zeros(u.shape + self.ctrl.shape[2:])
+		for a in range(self.deg_v + 1):
+			for b in range(self.deg_u + 1):
+				out += (Nv[..., a]*Nu[..., b])[..., None]*self.ctrl[sv - self.deg_v + a, su - self.deg_u + b]
+		return out
+
+	def grid(self, u, v):
+		'''Points on self at every (v[i], u[j]) as array of shape (len(v), len(u), 3)'''
+		return np.einsum('iv,vud,ju->ijd', self._matrix(self.deg_v, self.knots_v, v), self.ctrl, self._matrix(self.deg_u, self.knots_u, u))
+
+	@staticmethod
+	def _matrix(deg, knots, x):
+		'''Dense basis matrix [N_j(x[i])]'''
+		x = np.asarray(x, dtype=float)
+		span, N = basis(deg, knots, x)
+
+		out = np.zeros((len(x), len(knots) - deg - 1))
+		for r in range(deg + 1):
+			out[np.arange(len(x)), span - deg + r] = N[:, r]
+		return out
+
+def fit_surf(pts, deg_u=3, deg_v=3, knots_u=None, knots_v=None):
+	'''Surface interpolating grid pts[v, u, xyz], e.g. one surface of Bamberger.gen_arr()
+
+	Without knots, parameters are chord-length averaged over the grid and knots averaged from them. With custom knots (e.g. from knot_arr), interpolation takes place at their Greville abscissae, which keeps the banded collocation systems nonsingular.
+	'''
+	pts = np.asarray(pts, dtype=float)
+	nv, nu = pts.shape[:2]
+
+	if knots_u is None:
+		params_u = chord_params(pts, 1)
+		knots_u = averaged_knots(deg_u, params_u)
+	else:
+		params_u = greville(deg_u, knots_u)
+
+	if knots_v is None:
+		params_v = chord_params(pts, 0)
+		knots_v = averaged_knots(deg_v, params_v)
+	else:
+		params_v = greville(deg_v, knots_v)
+
+	assert len(params_u) == nu and len(params_v) == nv, 'Knot vectors must provide one control point per grid point'
+
+	# Interpolate every section curve along u, then every resulting control column along v
+	rows = solve_banded(collocation(deg_u, knots_u, params_u), pts.transpose(1, 0, 2), deg_u).transpose(1, 0, 2)
+	ctrl = solve_banded(collocation(deg_v, knots_v, params_v), rows, deg_v)
+
+	return Surface(deg_u, deg_v, knots_u, knots_v, ctrl)
+
+def fit_blade(pts, deg_u=3, deg_v=3, knots_u=None, knots_v=None):
+	'''Upper and lower Surfaces interpolating the (2, num_secs, num_pts, 3) grid of Bamberger.gen_arr()'''
+	return dict([(key, fit_surf(pts[j], deg_u, deg_v, knots_u, knots_v)) for j, key in enumerate(('upper', 'lower'))])
@@ -0,0 +1,167 @@
+from __future__ import division
+
+import math
+
+from linalg import Matrix, Vector
+
+class Dual(object):
+	'''Forward-mode AD value: self.val together with its gradient self.grad with respect to every seeded variable'''
+
+	__slots__ = ('val', 'grad')
+
+	def __init__(self, val, grad):
+		'''Stores value as self.val and gradient as tuple self.grad'''
+		self.val = val
+		self.grad = tuple(grad)
+
+	def __repr__(self):
+		'''Prints self as "Dual(<val>, <grad>)"'''
+		return 'Dual(' + repr(self.val) + ', ' + repr(self.grad) + ')'
+
+	def _chain(self, val, d):
+		'''Dual with value val and gradient d*self.grad'''
+		return Dual(val, [d*it for it in self.grad])
+
+	def __add__(self, other):
+		'''Sum of self and Dual or number other'''
+		if isinstance(other, Dual):
+			return Dual(self.val + other.val, [a + b for a, b in zip(self.grad, other.grad)])
+		return Dual(self.val + other, self.grad)
+
+	__radd__ = __add__
+
+	def __sub__(self, other):
+		'''Difference of self and Dual or number other'''
+		if isinstance(other, Dual):
+			return Dual(self.val - other.val, [a - b for a, b in zip(self.grad, other.grad)])
+		return Dual(self.val - other, self.grad)
+
+	def __rsub__(self, other):
+		'''Difference of number other and self'''
+		return self._chain(other - self.val, -1)
+
+	def __mul__(self, other):
+		'''Product of self and Dual or number other'''
+		if isinstance(other, Dual):
+			return Dual(self.val*other.val, [self.val*b + other.val*a for a, b in zip(self.grad, other.grad)])
+		return self._chain(self.val*other, other)
+
+	__rmul__ = __mul__
+
+	def __truediv__(self, other):
+		'''Quotient of self and Dual or number other'''
+		if isinstance(other, Dual):
+			q = self.val/other.val
+			return Dual(q, [(a - q*b)/other.val for a, b in zip(self.grad, other.grad)])
+		return self._chain(self.val/other, 1/other)
+
+	def __rtruediv__(self, other):
+		'''Quotient of number other and self'''
+		q = other/self.val
+		return self._chain(q, -q/self.val)
+
+	__div__ = __truediv__
+	__rdiv__ = __rtruediv__
+
+	def __pow__(self, other):
+		'''self raised to Dual or number other'''
+		if isinstance(other, Dual):
+			return exp(other*log(self))
+		if other == 0:
+			return self._chain(1.0, 0)
+		return self._chain(self.val**other, other*self.val**(other - 1))
+
+	def __rpow__(self, other):
+		'''Number other raised to self'''
+		out = other**self.val
+		return self._chain(out, out*math.log(other) if other != 0 else 0)
+
+	def __neg__(self):
+		'''Negation of self'''
+		return self._chain(-self.val, -1)
+
+	def __pos__(self):
+		'''self'''
+		return self
+
+	def __abs__(self):
+		'''Absolute value of self, with the gradient of self at 0'''
+		return -self if self.val < 0 else self
+
+	# Comparisons act on values, so branches (Piecewise, NACA4m camber and thickness) follow the primal evaluation
+	def __lt__(self, other):
+		return self.val < value(other)
+
+	def __le__(self, other):
+		return self.val <= value(other)
+
+	def __gt__(self, other):
+		return self.val > value(other)
+
+	def __ge__(self, other):
+		return self.val >= value(other)
+
+	def __eq__(self, other):
+		return self.val == value(other)
+
+	def __ne__(self, other):
+		return self.val != value(other)
+
+	def __hash__(self):
+		return hash(self.val)
+
+def is_dual(x):
+	'''True if x is a Dual'''
+	return isinstance(x, Dual)
+
+def value(x):
+	'''Value of Dual or number x'''
+	return x.val if isinstance(x, Dual) else x
+
+def gradient(x, n):
+	'''Gradient of Dual or number x with respect to n seeded variables, as tuple'''
+	return x.grad if isinstance(x, Dual) else (0.0,)*n
+
+def seed(vals, offset=0, n=None):
+	'''Duals for the independent variables vals, the ith of which is variable offset+i out of n (default len(vals))'''
+	n = len(vals) if n is None else n
+	return [Dual(float(it), [float(j == offset + i) for j in range(n)]) for i, it in enumerate(vals)]
+
+def derivative(f, x):
+	'''Derivative of callable f at number x by one forward-mode evaluation'''
+	return gradient(f(Dual(x, [1.0])), 1)[0]
+
+def _unary(fn, dfn):
+	'''Elementary function applying fn to numbers and differentiating through dfn for Duals'''
+	def out(x):
+		if isinstance(x, Dual):
+			return x._chain(fn(x.val), dfn(x.val))
+		return fn(x)
+	out.__name__ = fn.__name__
+	out.__doc__ = fn.__doc__
+	return out
+
+# Drop-in replacements for math's functions that also accept Duals
+sqrt = _unary(math.sqrt, lambda x: 0.5/math.sqrt(x))
+exp = _unary(math.exp, math.exp)
+log = _unary(math.log, lambda x: 1/x)
+sin = _unary(math.sin, math.cos)
+cos = _unary(math.cos, lambda x: -math.sin(x))
+tan = _unary(math.tan, lambda x: 1 + math.tan(x)**2)
+atan = _unary(math.atan, lambda x: 1/(1 + x*x))
+
+def solve(rows, rhs):
+	'''Solves the linear system with matrix rows and right-hand side rhs, either of which may hold Duals, as list
+
+	The float system is factored once and each gradient follows from the implicit derivative A*dx = db - dA*x, solved against the same factors.
+	'''
+	if not any([is_dual(it) for row in rows for it in row] + [is_dual(it) for it in rhs]):
+		return list(Matrix(rows).solve(Vector(rhs)))
+
+	n = max([len(it.grad) for row in rows + [rhs] for it in row if is_dual(it)])
+	lu = Matrix([[value(it) for it in row] for row in rows]).factor()
+
+	x = lu._solve([value(it) for it in rhs])
+	grads = lu.solve_many([[gradient(bi, n)[k] - sum([gradient(aij, n)[k]*xj for aij, xj in zip(row, x)]) for row, bi in zip(rows, rhs)] for k in range(n)])
+
+	return [Dual(xi, [dx[i] for dx in grads]) for i, xi in enumerate(x)]
@@ -0,0 +1,91 @@
+from __future__ import division
+
+import struct
+
+import numpy as np
+
+# Binary STL facet record: normal, three vertices and the (unused) attribute byte count, packed to 50 bytes
+stl_facet = np.dtype([('normal', '<f4', (3,)), ('verts', '<f4', (3, 3)), ('attr', '<u2')])
+
+def _facets(prev, curr, flip):
+	'''STL facets triangulating the strip between adjacent sections prev and curr, each of shape (num_pts, 3)'''
+	a, b = prev[:-1], prev[1:]
+	c, d = curr[:-1], curr[1:]
+
+	tris = np.concatenate([np.stack([a, b, d], axis=1), np.stack([a, d, c], axis=1)])
+	if flip:
+		tris = tris[:, ::-1]
+
+	out = np.zeros(len(tris), dtype=stl_facet)
+	out['verts'] = tris
+
+	normal = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+	norm = np.linalg.norm(normal, axis=1, keepdims=True)
+	out['normal'] = normal/np.where(norm == 0, 1, norm)
+
+	return out
+
+def write_stl(path, blade, num_secs, num_pts, f=lambda t: t, header=b'blade_gen'):
+	'''Streams upper and lower surfaces of blade.gen_iter(num_secs, num_pts, f) to binary STL at path, one section at a time
+
+	Surfaces are triangulated between adjacent sections and points, with the lower surface wound opposite to the upper so both normals face outward. Root, tip and trailing-edge caps are not included.
+	'''
+	num_tris = 2*2*(num_secs - 1)*(num_pts - 1)
+
+	with open(path, 'wb') as out:
+		out.write(header[:80].ljust(80, b'\0'))
+		out.write(struct.pack('<I', num_tris))
+
+		prev = None
+		for slab in blade.gen_iter(num_secs, num_pts, f):
+			if prev is not None:
+				for j in range(2):
+					_facets(prev[j], slab[j, 0], flip=j == 1).tofile(out)
+			prev = slab[:, -1]
+
+def write_rotor_stl(path, rotor, header=b'blade_gen'):
+	'''Streams every blade of rotor.Rotor rotor, built on a (2, num_secs, num_pts, 3) grid, to binary STL at path, one blade at a time
+
+	Each blade is triangulated as in write_stl(); only one rotated copy of the shared grid is held in memory.
+	'''
+	num_secs, num_pts = rotor.base.shape[1:3]
+	num_tris = len(rotor)*2*2*(num_secs - 1)*(num_pts - 1)
+
+	with open(path, 'wb') as out:
+		out.write(header[:80].ljust(80, b'\0'))
+		out.write(struct.pack('<I', num_tris))
+
+		for pts in rotor:
+			for i in range(1, num_secs):
+				for j in range(2):
+					_facets(pts[j, i - 1], pts[j, i], flip=j == 1).tofile(out)
+
+def write_plot3d(path, blade, num_secs, num_pts, f=lambda t: t):
+	'''Streams blade.gen_iter(num_secs, num_pts, f) to a binary multi-block Plot3D grid at path, one section at a time
+
+	The file holds two blocks (upper, lower) of dimensions (num_pts, num_secs, 1) as little-endian int32 headers and float64 coordinates without Fortran record markers. Each section is written at its offsets in the X, Y and Z planes, so only one section is held in memory.
+	'''
+	plane = num_pts*num_secs*8
+	head = 4 + 2*3*4
+
+	with open(path, 'wb') as out:
+		out.write(struct.pack('<7i', 2, num_pts, num_secs, 1, num_pts, num_secs, 1))
+		out.truncate(head + 2*3*plane)
+
+		for i, slab in enumerate(blade.gen_iter(num_secs, num_pts, f)):
+			for j in range(2):
+				for k in range(3):
+					out.seek(head + (3*j + k)*plane + i*num_pts*8)
+					out.write(np.ascontiguousarray(slab[j, 0, :, k], dtype='<f8').tobytes())
+
+def write_npy(path, blade, num_secs, num_pts, f=lambda t: t):
+	'''Streams blade.gen_iter(num_secs, num_pts, f) into a (2, num_secs, num_pts, 3) float64 .npy file at path, returned as a read-only memory map'''
+	out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(2, num_secs, num_pts, 3))
+
+	for i, slab in enumerate(blade.gen_iter(num_secs, num_pts, f)):
+		out[:, i] = slab[:, 0]
+
+	out.flush()
+	del out
+
+	return np.load(path, mmap_mode='r')
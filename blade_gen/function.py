@@ -1,9 +1,72 @@
 from __future__ import division
 
-from math import sin, cos, tan, atan
+from dual import sin, cos, tan, atan
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
 
 from linalg import Matrix, Vector
-from helper import dot, prod
+from helper import dot, prod, linspace, quad
+
+def _lit(x):
+	'''Source literal for a folded constant or the name of an emitted value'''
+	return x if isinstance(x, str) else repr(float(x))
+
+class Kernel(object):
+	'''Flat NumPy evaluation of a Function tree, generated by Function.compile()'''
+
+	def __init__(self):
+		'''Initializes empty kernel, recording emitted assignments as self.lines and their names by expression as self.vars'''
+		self.lines = []
+		self.vars = {}
+		self.refs = {}
+		self.emitted = {}
+		self.ns = {'np': np}
+
+		self.source = None
+		self.fn = None
+
+	def __call__(self, t):
+		'''Evaluates kernel at scalar or array t'''
+		out = self.fn(np.asarray(t, dtype=float))
+		return float(out) if np.ndim(out) == 0 else out
+
+	def bind(self, expr):
+		'''Name for the value of expr, emitting an assignment only the first time expr is seen'''
+		if not isinstance(expr, str) or expr == 't' or expr in self.vars.values():
+			return expr
+		if expr not in self.vars:
+			self.vars[expr] = 'v' + str(len(self.lines))
+			self.lines.append(self.vars[expr] + ' = ' + expr)
+		return self.vars[expr]
+
+	def ref(self, obj):
+		'''Name under which the opaque callable obj is visible to the kernel'''
+		if id(obj) not in self.refs:
+			self.refs[id(obj)] = 'f' + str(len(self.refs))
+			self.ns[self.refs[id(obj)]] = obj
+		return self.refs[id(obj)]
+
+	def emit(self, f, arg):
+		'''Emits f evaluated at arg, calling f opaquely if it is not a Function'''
+		if hasattr(f, '_emit'):
+			if not isinstance(arg, str):
+				return f._emit(self, arg)
+			if (id(f), arg) not in self.emitted:
+				self.emitted[id(f), arg] = f._emit(self, arg)
+			return self.emitted[id(f), arg]
+		elif not isinstance(arg, str):
+			return float(f(arg))
+		else:
+			return self.bind(self.ref(f) + '(' + arg + ')')
+
+	def finish(self, out):
+		'''Generates self.source returning out and compiles it as self.fn'''
+		self.source = 'def kernel(t):\n' + ''.join(['\t' + line + '\n' for line in self.lines]) + '\treturn ' + _lit(out) + ' + 0*t\n'
+		exec(compile(self.source, '<Function.compile>', 'exec'), self.ns)
+		self.fn = self.ns['kernel']
 
 class Curve(object):
 	def __init__(self, funcs):
@@ -24,6 +87,15 @@ class Curve(object):
 		else:
 			return self._int_2b(a, b, num_pts)
 
+def _breaks(funcs):
+	'''Sorted union of the breaks of every Function in funcs'''
+	return sorted(set([t0 for f in funcs if hasattr(f, 'breaks') for t0 in f.breaks()]))
+
+def _phase(kern, arg, freq, phase):
+	'''Emitted freq*arg + phase with unit frequency and zero phase simplified'''
+	out = arg if freq == 1 else _lit(freq) + '*' + arg
+	return kern.bind(out if phase == 0 else out + ' + ' + _lit(phase))
+
 class Function(object):
 	'''Parent class for functions to implement integration, fallback {+,*} to form {Sum,Product} if child fails to define {+,*}'''
 
@@ -39,30 +111,64 @@ class Function(object):
 		'''Returns Product of Function self and Function others'''
 		return Product([self, other])
 
+	def compile(self):
+		'''Flattens self into a single Kernel over NumPy arrays, folding constants and evaluating repeated subexpressions once'''
+		assert np is not None, 'Function.compile() requires NumPy'
+
+		kern = Kernel()
+		kern.finish(kern.emit(self, 't'))
+		return kern
+
+	def _emit(self, kern, arg):
+		'''Emits code evaluating self at arg into kern, returning a value name or a folded constant'''
+		if not isinstance(arg, str):
+			return float(self(arg))
+		if not hasattr(self, '_expr'):
+			# Children without an emitter are called per element, since their __call__ may only accept scalars
+			return kern.bind(kern.ref(np.vectorize(self, otypes=[float])) + '(' + arg + ')')
+		return kern.bind(self._expr(kern, arg))
+
+	def breaks(self):
+		'''Points where self may be discontinuous, across which numerical integration must not step'''
+		return []
+
+	def antiderivative(self):
+		'''Functional antiderivative of self, for children with a closed form'''
+		raise NotImplementedError('No closed-form antiderivative for ' + type(self).__name__)
+
 	def _int_trap(self, a, b, num):
 		'''Computes trapezoidal [a,b]-bounded Riemann integral'''
 		x = linspace(a, b, num)
-		return sum([0.5*(self(x[i-1])+self(x[i])) * (x[i]-x[i-1]) for i in range(1, num)])
+		y = [self(it) for it in x]
+		return sum([0.5*(y[i-1] + y[i]) * (x[i]-x[i-1]) for i in range(1, num)])
+
+	def _int_quad(self, a, b, abstol, reltol):
+		'''Computes adaptive Gauss-Kronrod [a,b]-bounded integral, evaluating each panel through self.compile() when NumPy is available'''
+		f = self if np is None else self.compile()
+		return quad(f, a, b, abstol, reltol, self.breaks(), vectorized=np is not None)[0]
 
 	def _int_1b(self, a):
 		'''Returns definite integral of self with lower bound a'''
 		F = self.antiderivative()
 		return Constant(-F(a)) + F
 
-	def _int_2b(self, a, b, num_pts = None):
-		'''Compute analytic [a,b]-bounded integral if self.antiderivative() is defined else num_pts-numeric'''
-		if num_pts is None and hasattr(self, 'antiderivative'):
+	def _int_2b(self, a, b, num_pts = None, abstol = 1e-10, reltol = 1e-10):
+		'''Compute num_pts-trapezoidal [a,b]-bounded integral if num_pts is given, else analytic if self.antiderivative() has a closed form, else adaptive to within abstol or reltol'''
+		if num_pts is not None:
+			return self._int_trap(a, b, num_pts)
+
+		try:
 			F = self.antiderivative()
-			return F(b) - F(a)
-		else:
-			return self._int_trap(a, b, 101 if num_pts is None else num_pts)
+		except NotImplementedError:
+			return self._int_quad(a, b, abstol, reltol)
+		return F(b) - F(a)
 
-	def int(self, a, b = None, num_pts = None):
-		'''Returns a- or (analytic or num_pts-numeric) [a,b]-bounded integral'''
+	def int(self, a, b = None, num_pts = None, abstol = 1e-10, reltol = 1e-10):
+		'''Returns a- or (analytic, num_pts-trapezoidal or adaptive) [a,b]-bounded integral'''
 		if b is None:
 			return self._int_1b(a)
 		else:
-			return self._int_2b(a, b, num_pts)
+			return self._int_2b(a, b, num_pts, abstol, reltol)
 
 class Sum(Function):
 	'''Implementation for summation of Functions'''
@@ -76,9 +182,24 @@ class Sum(Function):
 		'''Evaluates Sum as sum of sub-function evaluations'''
 		return sum([f(t) for f in self.funcs])
 
+	def breaks(self):
+		'''Union of addend breaks'''
+		return _breaks(self.funcs)
+
+	def _expr(self, kern, arg):
+		'''Sum of emitted addends with constant addends folded'''
+		terms = [kern.emit(f, arg) for f in self.funcs]
+
+		const = sum([it for it in terms if not isinstance(it, str)])
+		names = [it for it in terms if isinstance(it, str)]
+
+		if names == []:
+			return const
+		return ' + '.join(names + ([_lit(const)] if const != 0 else []))
+
 	def antiderivative(self):
 		'''Returns functional antiderivative of Sum as sum of sub-function antiderivatives'''
-		return sum([it.antiderivative() for it in self.funcs])
+		return Sum([it.antiderivative() for it in self.funcs])
 
 class Product(Function):
 	'''Implementation for product of Functions'''
@@ -92,18 +213,42 @@ class Product(Function):
 		'''Evaluates Product as product of sub-function evaluations'''
 		return prod([f(t) for f in self.funcs])
 
+	def breaks(self):
+		'''Union of factor breaks'''
+		return _breaks(self.funcs)
+
+	def _expr(self, kern, arg):
+		'''Product of emitted factors with constant factors folded'''
+		terms = [kern.emit(f, arg) for f in self.funcs]
+
+		const = prod([it for it in terms if not isinstance(it, str)])
+		names = [it for it in terms if isinstance(it, str)]
+
+		if names == [] or const == 0:
+			return const
+		return '*'.join(([_lit(const)] if const != 1 else []) + names)
+
 class Composite(Function):
 	'''Implementation for Function with Function as its argument'''
 
 	def __init__(self, base, arg):
-		'''Initialize with inner function as self.func and outer function as self.arg'''
-		self.func = func
+		'''Initialize with outer function as self.base and inner function as self.arg'''
+		self.base = base
 		self.arg = arg
+		super(Composite, self).__init__()
 
-	def __call__(t):
+	def __call__(self, t):
 		'''Evaluate self by evaluating self.arg recursively'''
 		return self.base(self.arg(t))
 
+	def breaks(self):
+		'''Breaks of the inner function'''
+		return _breaks([self.arg])
+
+	def _expr(self, kern, arg):
+		'''Outer function emitted at the emitted inner function'''
+		return kern.emit(self.base, kern.emit(self.arg, arg))
+
 class Piecewise(Function):
 	''''''
 
@@ -119,13 +264,26 @@ class Piecewise(Function):
 
 		super(Piecewise, self).__init__(**kwargs)
 
-	def __call__(t):
+	def __call__(self, t):
 		''''''
 		for i, t0 in enumerate(self.bounds):
 			if t0 > t:
 				return self.funcs[i](t)
 		return self.funcs[-1](t)
 
+	def breaks(self):
+		'''Branch bounds together with the breaks of each branch'''
+		return sorted(set(self.bounds + _breaks(self.funcs)))
+
+	def _expr(self, kern, arg):
+		'''Branches selected elementwise by nested np.where'''
+		vals = [kern.emit(f, arg) for f in self.funcs]
+
+		out = _lit(vals[-1])
+		for t0, val in reversed(list(zip(self.bounds, vals[:-1]))):
+			out = 'np.where(' + arg + ' < ' + _lit(t0) + ', ' + _lit(val) + ', ' + out + ')'
+		return out
+
 	# def is_cont(ord=0, t=None):
 	# 	assert isinstance(ord, 'int'), 'Order of continuity must be an integer'
 	#
@@ -149,8 +307,11 @@ class Piecewise(Function):
 	# 	return self.is_cont(2, t)
 
 	def antiderivative(self):
-		''''''
-		return Piecewise([Constant(sum(self.funcs[:i](bound[i-1]))) + f.antiderivative() for i, f in enumerate(self.funcs)], bounds)
+		'''Piecewise antiderivative of the branches, shifted by constants to be continuous across the bounds'''
+		pieces = [f.antiderivative() for f in self.funcs]
+		for i, t0 in enumerate(self.bounds):
+			pieces[i+1] = Sum([Constant(pieces[i](t0) - pieces[i+1](t0)), pieces[i+1]])
+		return Piecewise(pieces, self.bounds)
 
 class Sin(Function):
 	'''Implementation for sine with variable frequency and phase shift'''
@@ -164,6 +325,10 @@ class Sin(Function):
 		'''Value of self at t'''
 		return sin(self.freq*t + self.phase)
 
+	def _expr(self, kern, arg):
+		'''np.sin of the emitted phase'''
+		return 'np.sin(' + _phase(kern, arg, self.freq, self.phase) + ')'
+
 class Cos(Function):
 	'''Implementation for cosine with variable frequency and phase shift'''
 
@@ -176,6 +341,10 @@ class Cos(Function):
 		'''Value of self at t'''
 		return cos(self.freq*t + self.phase)
 
+	def _expr(self, kern, arg):
+		'''np.cos of the emitted phase'''
+		return 'np.cos(' + _phase(kern, arg, self.freq, self.phase) + ')'
+
 class Tan(Function):
 	'''Implementation for tangent with variable frequency and phase shift'''
 
@@ -188,6 +357,10 @@ class Tan(Function):
 		'''Value of self at t'''
 		return tan(self.freq*t + self.phase)
 
+	def _expr(self, kern, arg):
+		'''np.tan of the emitted phase'''
+		return 'np.tan(' + _phase(kern, arg, self.freq, self.phase) + ')'
+
 class Atan(Function):
 	'''Implementation for arctangent'''
 
@@ -197,6 +370,10 @@ class Atan(Function):
 	def __call__(self, t):
 		return atan(t)
 
+	def _expr(self, kern, arg):
+		'''np.arctan of the argument'''
+		return 'np.arctan(' + arg + ')'
+
 class Power(Function):
 	'''Implementation for exponentiation as coeff*(x**pow)'''
 
@@ -217,8 +394,24 @@ class Power(Function):
 		else:
 			return self.coeff * pow(t, self.pow)
 
+	def _expr(self, kern, arg):
+		'''Scaled np.power of the argument, with trivial coefficients and exponents simplified'''
+		if self.coeff == 0 or self.pow == 0:
+			return float(self.coeff)
+
+		if self.pow == 1:
+			base = arg
+		elif self.pow == 0.5:
+			base = kern.bind('np.sqrt(' + arg + ')')
+		else:
+			base = kern.bind('np.power(' + arg + ', ' + _lit(self.pow) + ')')
+
+		return base if self.coeff == 1 else _lit(self.coeff) + '*' + base
+
 	def antiderivative(self):
 		'''Returns functional antiderivative of self as Power'''
+		if self.pow == -1:
+			raise NotImplementedError('Antiderivative of x**-1 is not a Power')
 		return Power(self.coeff/(1+self.pow), 1+self.pow)
 
 class Root(Power):
@@ -271,5 +464,3 @@ class Polynomial(Sum):
 	def antiderivative(self):
 		'''Computes antiderivative of self as sum of antiderivatives of self.funcs'''
 		return Polynomial([0] + [coeff/(i+1) for i, coeff in enumerate(self.coeffs)])
-
-	@staticmethod
@@ -89,7 +89,7 @@ def knot_arr(deg, rank, f=lambda t: t, mults=None):
 
     t = linspace(0, 1, len(mults))
     vals = [f(val) for val in t]
-	print(vals)
+    print(vals)
 
     return Array[Knot]([Knot(v, m) for (v, m) in zip(vals, mults)])
 
@@ -1,24 +1,351 @@
 from __future__ import division
 
-from math import floor, ceil
+from math import floor, ceil, cos, pi
+from collections import OrderedDict
+from array import array
+from heapq import heappush, heappop
+from bisect import bisect_right
 
-from linalg import Matrix, Vector
+from dual import is_dual, solve
+
+# NumPy is optional in the modules SpaceClaim loads (helper, function, blade), since its IronPython ships without it.
+# Each imports it as np or None; scalar paths never need it, and array paths (array interpolants, Function.compile(),
+# Bamberger.gen_arr() and relatives) assert it is present.
+try:
+	import numpy as np
+except ImportError:
+	np = None
 
 def linspace(first, last, num=101):
 	'''List of num evenly-spaced points in [first, last]'''
 	diff = (last-first)/(num-1) if num > 1 else 0
 	return [first + it*diff for it in range(num)]
 
-def interp(x, y):
-	'''Lowest-degree polynomial that exactly interpolates y(x)'''
+def dot(x, y):
+	'''Inner product of sequences x and y'''
+	return sum([xi*yi for xi, yi in zip(x, y)])
+
+def prod(x):
+	'''Product of entries in x'''
+	out = 1
+	for it in x:
+		out *= it
+	return out
+
+def interp(x, y, form='power', slopes=None):
+	'''Interpolant of y(x): the lowest-degree polynomial in monomial (form='power') or barycentric (form='barycentric') representation, or a natural (form='natural'), clamped (form='clamped', with end slopes=(first, last)) or monotone (form='pchip') cubic spline'''
 	if not hasattr(x, '__len__') and not hasattr(y, '__len__'):
-		return lambda x: y
+		return Interpolant([y])
 	else:
 		assert len(x) == len(y), 'Input and output dimensions must match'
 
-		sys = Matrix([[xi**j for j in range(len(y))] for xi in x])
-		rhs = Vector(y)
+		if form == 'barycentric':
+			return BarycentricInterpolant(x, y)
+		if form in ('natural', 'clamped'):
+			return Spline(x, y, _spline_slopes(x, y, slopes if form == 'clamped' else None))
+		if form == 'pchip':
+			return Spline(x, y, _pchip_slopes(x, y))
+		assert form == 'power', 'Unknown interpolant form ' + str(form)
+
+		coeffs = solve([[xi**j for j in range(len(y))] for xi in x], y)
+
+		return Interpolant(coeffs)
+
+def _store(vals):
+	'''Compact array('d') of vals, or a list when any of them is a Dual'''
+	vals = list(vals)
+	return vals if any([is_dual(it) for it in vals]) else array('d', vals)
+
+class Interpolant(object):
+	'''Polynomial in monomial form, evaluated by Horner's scheme on scalars or NumPy arrays'''
+
+	def __init__(self, coeffs):
+		'''Stores coefficients in ascending order of degree as self.coeffs'''
+		self.coeffs = _store(coeffs)
+
+	def __call__(self, x):
+		'''Value of self at x'''
+		out = self.coeffs[-1] + 0*x
+		for ai in reversed(self.coeffs[:-1]):
+			out = out*x + ai
+		return out
+
+	def deg(self):
+		'''Degree of self'''
+		return len(self.coeffs) - 1
+
+class BarycentricInterpolant(object):
+	'''Polynomial through (x, y) in second barycentric form, which stays well-conditioned for many knots'''
+
+	def __init__(self, x, y):
+		'''Stores knots as self.x, values as self.y and barycentric weights as self.w'''
+		self.x = _store(x)
+		self.y = _store(y)
+
+		self.w = _store([1]*len(x)) if isinstance(self.x, array) else [1]*len(x)
+		for j, xj in enumerate(x):
+			for k, xk in enumerate(x):
+				if k != j:
+					self.w[j] /= xj - xk
+
+	def __call__(self, x):
+		'''Value of self at x'''
+		if hasattr(x, 'shape'):
+			return self._call_arr(x)
+
+		num = 0
+		den = 0
+		for xj, yj, wj in zip(self.x, self.y, self.w):
+			if x == xj:
+				return yj
+			c = wj/(x - xj)
+			num += c*yj
+			den += c
+		return num/den
+
+	def _call_arr(self, x):
+		'''Value of self at every entry of NumPy array x'''
+		if x.ndim == 0:
+			return self(float(x))
+
+		xs, ys, ws = [np.frombuffer(it) for it in (self.x, self.y, self.w)]
+
+		diff = x[..., None] - xs
+		hit = diff == 0
+		diff[hit] = 1
+
+		c = ws/diff
+		out = np.sum(c*ys, axis=-1)/np.sum(c, axis=-1)
+
+		knot = np.any(hit, axis=-1)
+		out[knot] = ys[np.argmax(hit[knot], axis=-1)]
+		return out
+
+	def deg(self):
+		'''Degree of self'''
+		return len(self.x) - 1
+
+def solve_tridiag(lower, diag, upper, rhs):
+	'''Solves the tridiagonal system with subdiagonal lower, diagonal diag and superdiagonal upper (lower[0] and upper[-1] unused) by the Thomas algorithm, as list'''
+	n = len(diag)
+
+	c = [0]*n
+	d = [0]*n
+	c[0] = upper[0]/diag[0] if n > 1 else 0
+	d[0] = rhs[0]/diag[0]
+	for i in range(1, n):
+		den = diag[i] - lower[i]*c[i-1]
+		c[i] = upper[i]/den if i < n - 1 else 0
+		d[i] = (rhs[i] - lower[i]*d[i-1])/den
+
+	for i in reversed(range(n - 1)):
+		d[i] = d[i] - c[i]*d[i+1]
+
+	return d
+
+def _spline_slopes(x, y, slopes=None):
+	'''Knot slopes of the natural cubic spline through (x, y), or of the clamped one with end slopes=(first, last)'''
+	n = len(x)
+	assert n > 1, 'Spline interpolation requires at least two knots'
+
+	h = [x[i+1] - x[i] for i in range(n - 1)]
+	dy = [(y[i+1] - y[i])/h[i] for i in range(n - 1)]
+
+	# Continuity of the second derivative at interior knots, in terms of the knot slopes
+	lower = [0] + [h[i] for i in range(1, n - 1)] + [1]
+	diag = [2] + [2*(h[i-1] + h[i]) for i in range(1, n - 1)] + [2]
+	upper = [1] + [h[i-1] for i in range(1, n - 1)] + [0]
+	rhs = [3*dy[0]] + [3*(h[i]*dy[i-1] + h[i-1]*dy[i]) for i in range(1, n - 1)] + [3*dy[-1]]
+
+	if slopes is not None:
+		diag[0], upper[0], rhs[0] = 1, 0, slopes[0]
+		lower[-1], diag[-1], rhs[-1] = 0, 1, slopes[1]
+
+	return solve_tridiag(lower, diag, upper, rhs)
+
+def _pchip_slopes(x, y):
+	'''Knot slopes of the shape-preserving piecewise cubic Hermite interpolant through (x, y) per Fritsch and Carlson 1980'''
+	n = len(x)
+	assert n > 1, 'Spline interpolation requires at least two knots'
+
+	h = [x[i+1] - x[i] for i in range(n - 1)]
+	dy = [(y[i+1] - y[i])/h[i] for i in range(n - 1)]
+
+	if n == 2:
+		return [dy[0], dy[0]]
+
+	m = [0]*n
+	for i in range(1, n - 1):
+		if dy[i-1]*dy[i] > 0:
+			w1 = 2*h[i] + h[i-1]
+			w2 = h[i] + 2*h[i-1]
+			m[i] = (w1 + w2)/(w1/dy[i-1] + w2/dy[i])
+
+	def end(h0, h1, d0, d1):
+		'''One-sided three-point slope, limited to keep the end interval monotone'''
+		out = ((2*h0 + h1)*d0 - h0*d1)/(h0 + h1)
+		if out*d0 <= 0:
+			return 0
+		if d0*d1 < 0 and abs(out) > abs(3*d0):
+			return 3*d0
+		return out
+
+	m[0] = end(h[0], h[1], dy[0], dy[1])
+	m[-1] = end(h[-1], h[-2], dy[-1], dy[-2])
+
+	return m
+
+class Spline(object):
+	'''Piecewise cubic Hermite interpolant with values y and slopes m at knots x, evaluated on scalars or NumPy arrays by bisection'''
+
+	def __init__(self, x, y, m):
+		'''Stores knots as self.x, values as self.y and slopes as self.m'''
+		self.x = _store(x)
+		self.y = _store(y)
+		self.m = _store(m)
+
+	def __call__(self, x):
+		'''Value of self at x, extrapolating the end cubics outside the knots'''
+		if hasattr(x, 'shape'):
+			return self._call_arr(x)
+
+		i = min(max(bisect_right(self.x, x) - 1, 0), len(self.x) - 2)
+		return self._hermite(x, self.x[i], self.x[i+1], self.y[i], self.y[i+1], self.m[i], self.m[i+1])
+
+	def _call_arr(self, x):
+		'''Value of self at every entry of NumPy array x'''
+		xs, ys, ms = [np.frombuffer(it) for it in (self.x, self.y, self.m)]
+
+		i = np.clip(np.searchsorted(xs, x, side='right') - 1, 0, len(xs) - 2)
+		return self._hermite(x, xs[i], xs[i+1], ys[i], ys[i+1], ms[i], ms[i+1])
+
+	@staticmethod
+	def _hermite(x, x0, x1, y0, y1, m0, m1):
+		'''Cubic Hermite basis evaluation on [x0, x1]'''
+		h = x1 - x0
+		s = (x - x0)/h
+		r = 1 - s
+		return r*r*((1 + 2*s)*y0 + s*h*m0) + s*s*((3 - 2*s)*y1 - r*h*m1)
+
+	def deg(self):
+		'''Degree of self'''
+		return 3
+
+_gauss_legendre = {}
+
+def gauss_legendre(n):
+	'''Nodes and weights of n-point Gauss-Legendre quadrature on [-1,1], computed once per n by Newton iteration on the Legendre recurrence'''
+	if n not in _gauss_legendre:
+		nodes = []
+		weights = []
+
+		for i in range(n):
+			z = cos(pi*(i + 0.75)/(n + 0.5))
+			for it in range(100):
+				p0, p1 = 1.0, z
+				for j in range(2, n+1):
+					p0, p1 = p1, ((2*j - 1)*z*p1 - (j - 1)*p0)/j
+				dp = n*(z*p1 - p0)/(z*z - 1)
+
+				dz = p1/dp
+				z -= dz
+				if abs(dz) < 1e-15:
+					break
+
+			nodes.append(-z)
+			weights.append(2/((1 - z*z)*dp*dp))
+
+		_gauss_legendre[n] = (nodes, weights)
+
+	return _gauss_legendre[n]
+
+# 15-point Kronrod nodes on [-1,1] with Kronrod weights, and the weights of the embedded 7-point Gauss rule at odd-indexed nodes
+_kronrod_x = [0.991455371120812639206854697526329, 0.949107912342758524526189684047851, 0.864864423359769072789712788640926, 0.741531185599394439863864773280788, 0.586087235467691130294144845693013, 0.405845151377397166906606412076961, 0.207784955007898467600689403773245]
+_kronrod_x = [-it for it in _kronrod_x] + [0.0] + list(reversed(_kronrod_x))
+_kronrod_w = [0.022935322010529224963732008058970, 0.063092092629978553290700663189204, 0.104790010322250183839876322541518, 0.140653259715525918745189590510238, 0.169004726639267902826583426598550, 0.190350578064785409913256402421014, 0.204432940075298892414161999234649]
+_kronrod_w = _kronrod_w + [0.209482141084727828012999174891714] + list(reversed(_kronrod_w))
+_gauss_w = [0.129484966168869693270611432679082, 0.279705391489276667901467771423780, 0.381830050505118944950369775488975]
+_gauss_w = _gauss_w + [0.417959183673469387755102040816327] + list(reversed(_gauss_w))
+
+def _gauss_kronrod(f, a, b, vectorized):
+	'''Kronrod estimate and Gauss-Kronrod error estimate of the integral of f on [a,b]'''
+	half = 0.5*(b - a)
+	mid = 0.5*(a + b)
+
+	x = [mid + half*it for it in _kronrod_x]
+	y = list(f(np.array(x))) if vectorized else [f(it) for it in x]
+
+	k = half*dot(_kronrod_w, y)
+	g = half*dot(_gauss_w, y[1::2])
+
+	return k, abs(k - g)
+
+def quad(f, a, b, abstol=1e-10, reltol=1e-10, breaks=(), vectorized=False, limit=200):
+	'''Adaptive 15-point Gauss-Kronrod integral of f on [a,b] and its error estimate, never integrating across breaks
+
+	With vectorized=True, f is called once per panel on a NumPy array of nodes. Panels with the largest error estimates are bisected until the total error is within max(abstol, reltol*|integral|) or limit panels are in use.
+	'''
+	if b < a:
+		val, err = quad(f, b, a, abstol, reltol, breaks, vectorized, limit)
+		return -val, err
+
+	pts = [a] + sorted(set([it for it in breaks if a < it < b])) + [b]
+
+	panels = []
+	for lo, hi in zip(pts[:-1], pts[1:]):
+		val, err = _gauss_kronrod(f, lo, hi, vectorized)
+		heappush(panels, (-err, lo, hi, val))
+
+	while len(panels) < limit:
+		total = sum([it[3] for it in panels])
+		err = -sum([it[0] for it in panels])
+		if err <= max(abstol, reltol*abs(total)):
+			break
+
+		neg_err, lo, hi, val = heappop(panels)
+		mid = 0.5*(lo + hi)
+		for lo_, hi_ in ((lo, mid), (mid, hi)):
+			val, err = _gauss_kronrod(f, lo_, hi_, vectorized)
+			heappush(panels, (-err, lo_, hi_, val))
+
+	return sum([it[3] for it in panels]), -sum([it[0] for it in panels])
+
+class LRUCache(object):
+	'''Bounded least-recently-used mapping with hit, miss and eviction counters'''
+
+	def __init__(self, maxsize=256):
+		'''Stores capacity as self.maxsize and entries in recency order as self.dat'''
+		self.maxsize = maxsize
+		self.dat = OrderedDict()
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		'''Number of entries currently cached'''
+		return len(self.dat)
+
+	def get(self, key, make):
+		'''Value cached at key, calling make() to compute and store it on a miss'''
+		if key in self.dat:
+			self.hits += 1
+			val = self.dat.pop(key)
+		else:
+			self.misses += 1
+			val = make()
+			if len(self.dat) >= self.maxsize:
+				self.dat.popitem(last=False)
+				self.evictions += 1
+
+		self.dat[key] = val
+		return val
 
-		coeffs = sys.solve(rhs)
+	def clear(self):
+		'''Drops all entries and resets counters'''
+		self.dat.clear()
+		self.hits = self.misses = self.evictions = 0
 
-		return lambda x: sum([ai*x**i for i, ai in enumerate(coeffs)])
+	def stats(self):
+		'''Counters and occupancy of self as dict'''
+		return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.dat), 'maxsize': self.maxsize}
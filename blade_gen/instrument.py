@@ -0,0 +1,76 @@
+from __future__ import division
+
+import json
+
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+class Stats(object):
+	'''Cumulative wall time and call count per stage, plus free-standing event counters'''
+
+	def __init__(self):
+		'''Initializes empty records as self.stages (name to [time, calls]) and self.counters (name to count)'''
+		self.stages = {}
+		self.counters = {}
+
+	def add(self, name, elapsed):
+		'''Records one call of stage name taking elapsed seconds'''
+		rec = self.stages.setdefault(name, [0, 0])
+		rec[0] += elapsed
+		rec[1] += 1
+
+	def as_dict(self):
+		'''Records of self as plain dict, with stage times in seconds and inclusive of nested stages'''
+		return {'stages': dict([(name, {'time': t, 'calls': n}) for name, (t, n) in self.stages.items()]), 'counters': dict(self.counters)}
+
+	def to_json(self, **kwargs):
+		'''Records of self as JSON string'''
+		return json.dumps(self.as_dict(), sort_keys=True, **kwargs)
+
+class _Stage(object):
+	'''Context manager timing one entry into a stage'''
+
+	def __init__(self, stats, name):
+		self.stats = stats
+		self.name = name
+
+	def __enter__(self):
+		self.start = timer()
+
+	def __exit__(self, *exc):
+		self.stats.add(self.name, timer() - self.start)
+
+class _Null(object):
+	'''Shared do-nothing context manager returned while recording is off'''
+
+	def __enter__(self):
+		pass
+
+	def __exit__(self, *exc):
+		pass
+
+_null = _Null()
+
+# Stats currently recording, or None when instrumentation is off
+active = None
+
+def stage(name):
+	'''Context manager attributing the enclosed time to stage name while recording, and doing nothing otherwise'''
+	return _null if active is None else _Stage(active, name)
+
+def count(name, n=1):
+	'''Increments counter name by n while recording'''
+	if active is not None:
+		active.counters[name] = active.counters.get(name, 0) + n
+
+@contextmanager
+def recording(stats=None):
+	'''Turns instrumentation on for the enclosed block, yielding the Stats that collect it'''
+	global active
+
+	prev = active
+	active = Stats() if stats is None else stats
+	try:
+		yield active
+	finally:
+		active = prev
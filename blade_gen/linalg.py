@@ -1,31 +1,59 @@
 from __future__ import division, print_function
 from operator import *
+from array import array
+
+from instrument import count
 
 class Matrix(object):
-	'''Implementation for 2d dense matrix'''
+	'''Implementation for 2d dense matrix, stored as flat array('d') self.dat with entry (i, j) at self.off + i*self.rs + j*self.cs so that transposes and blocks are views sharing storage'''
+
+	__slots__ = ('dat', 'm', 'n', 'off', 'rs', 'cs')
 
 	def __init__(self, dat = None):
-		'''Initializes self by storing entries as self.dat and computing number of rows self.m and number of columns self.n'''
-		self.m = len(dat) if hasattr(dat, '__len__') else int(dat is not None)
-		self.n = len(dat[0]) if hasattr(dat[0], '__len__') else int(dat[0] is not None)
+		'''Initializes self by storing entries row-major as self.dat and computing number of rows self.m and number of columns self.n'''
+		rows = [list(row) if hasattr(row, '__len__') else [row] for row in dat]
+
+		self.m = len(rows)
+		self.n = len(rows[0]) if rows else 0
+
+		self.dat = array('d', [it for row in rows for it in row])
+		self.off, self.rs, self.cs = 0, self.n, 1
 
-		self.dat = list([list(row) for row in dat])  # TO-DO: polish this up, time permitting
+	@classmethod
+	def _view(cls, dat, m, n, off, rs, cs):
+		'''Instance of cls over storage dat without copying'''
+		out = cls.__new__(cls)
+		out.dat, out.m, out.n, out.off, out.rs, out.cs = dat, m, n, off, rs, cs
+		return out
+
+	@classmethod
+	def zeros(cls, m, n):
+		'''m-by-n Matrix of zeros'''
+		return Matrix._view(array('d', [0.0])*(m*n), m, n, 0, n, 1)
 
 	def __len__(self):
 		'''Total number of entries in self'''
-		return sum([len(row) for row in self.dat])
+		return self.m*self.n
+
+	def _index(self, i, j):
+		'''Storage index of row i, column j, either of which may count from the end'''
+		i = i if i >= 0 else i + self.m
+		j = j if j >= 0 else j + self.n
+		if not (0 <= i < self.m and 0 <= j < self.n):
+			raise IndexError('Matrix index out of range')
+		return self.off + i*self.rs + j*self.cs
 
 	def __getitem__(self, inds):
 		'''Value at row i, column j'''
-		return self.dat[inds[0]][inds[1]]
+		return self.dat[self._index(*inds)]
 
 	def __setitem__(self, inds, val):
 		'''Set value at row i, column j to val'''
-		self.dat[inds[0]][inds[1]] = val
+		self.dat[self._index(*inds)] = val
 
 	def __str__(self):
 		'''Prints contents of self'''
-		return [str(row) + '\n' for row in dat]
+		return '\n'.join([str(row) for row in self.tolist()])
 
 	def __mul__(self, x):
 		'''Product of self and x if the operation is well-defined'''
@@ -44,6 +72,24 @@ class Matrix(object):
 		if isinstance(x, Vector):
 			return self.solve(x)
 
+	def __iadd__(self, x):
+		'''Adds scalar or same-shaped Matrix x to self in place'''
+		return self._update(x, lambda a, b: a + b)
+
+	def __isub__(self, x):
+		'''Subtracts scalar or same-shaped Matrix x from self in place'''
+		return self._update(x, lambda a, b: a - b)
+
+	def __imul__(self, c):
+		'''Scales self by c in place'''
+		return self._update(c, lambda a, b: a*b)
+
+	def __itruediv__(self, c):
+		'''Divides self by c in place'''
+		return self._update(1/c, lambda a, b: a*b)
+
+	__idiv__ = __itruediv__
+
 	# def __pow__(self, n):  # WIP
 	# 	if n < 0:
 	# 		return self.inv()*self**(-n)
@@ -52,39 +98,91 @@ class Matrix(object):
 	# 	else:
 	# 		return self
 
-	# def __iter__(self):  # WIP
-	# 	'''Initializes iterator for self as iterator through self.dat'''
-	# 	return iter(self.dat[0])
-	#
-	# def __next__(self):
-	# 	'''Increments iterator through elements of self in row-major order'''
-	# 	try:
-	# 		return next(self.dat)
-	# 	except StopIteration:
-	# 		return iter(self.dat[])
+	def _indices(self):
+		'''Storage index of every entry of self in row-major order'''
+		return [self.off + i*self.rs + j*self.cs for i in range(self.m) for j in range(self.n)]
+
+	def _update(self, x, op):
+		'''Replaces every entry a of self by op(a, b), with b the matching entry of Matrix x or scalar x'''
+		dat = self.dat
+		if isinstance(x, Matrix):
+			assert (x.m, x.n) == (self.m, self.n), 'Matrix dimensions must match'
+			for k, l in zip(self._indices(), x._indices()):
+				dat[k] = op(dat[k], x.dat[l])
+		else:
+			for k in self._indices():
+				dat[k] = op(dat[k], x)
+		return self
+
+	def _row(self, i):
+		'''Entries of row i as list'''
+		start = self.off + i*self.rs
+		if self.cs == 1:
+			return self.dat[start:start + self.n].tolist()
+		return [self.dat[start + j*self.cs] for j in range(self.n)]
+
+	def tolist(self):
+		'''Entries of self as list of row lists'''
+		return [self._row(i) for i in range(self.m)]
+
+	def copy(self):
+		'''Compact row-major copy of self'''
+		if self.off == 0 and self.rs == self.n and self.cs == 1 and len(self.dat) == self.m*self.n:
+			return Matrix._view(array('d', self.dat), self.m, self.n, 0, self.n, 1)
+		return Matrix(self.tolist())
 
 	def _mul_const(self, c):
 		'''Scalar product of self and c'''
-		return Matrix([[float(c)*it for it in row] for row in self.dat])
-
-	def _mul_vec(self, b):
-		'''Vector product of self and b'''
-		return Vector([sum([row[j]*b[j] for j in range(len(b))]) for row in self.dat])
+		out = self.copy()
+		out *= float(c)
+		return out
+
+	def _mul_vec(self, b, out = None):
+		'''Vector product of self and b, written into Vector out if given'''
+		assert len(b) == self.n, 'Vector dimension must match number of columns'
+
+		if out is None:
+			out = Vector.zeros(self.m)
+
+		x = list(b)
+		dat, cs = self.dat, self.cs
+		for i in range(self.m):
+			k = self.off + i*self.rs
+			acc = 0.0
+			for xj in x:
+				acc += dat[k]*xj
+				k += cs
+			out[i] = acc
+		return out
 
 	def _div_const(self, c):
 		'''Scalar quotient of self and c'''
-		return Matrix([[it/float(c) for it in row] for row in self.dat])
+		out = self.copy()
+		out /= float(c)
+		return out
 
 	def is_square(self):
 		'''True if self has the same number of rows and columns, False otherwise'''
 		return self.m == self.n
 
 	def transpose(self):
-		'''Transpose of self as new Matrix'''
-		return Matrix([[self[j,i] for j in range(self.n)] for i in range(self.m)])
+		'''Transpose of self as view sharing storage with self'''
+		return Matrix._view(self.dat, self.n, self.m, self.off, self.cs, self.rs)
+
+	def block(self, i0, i1, j0, j1):
+		'''Submatrix of rows i0:i1 and columns j0:j1 as view sharing storage with self'''
+		return Matrix._view(self.dat, i1 - i0, j1 - j0, self.off + i0*self.rs + j0*self.cs, self.rs, self.cs)
+
+	def row(self, i):
+		'''Row i as Vector view sharing storage with self'''
+		return Vector._view(self.dat, self.n, 1, self.off + i*self.rs, self.cs, 1)
+
+	def col(self, j):
+		'''Column j as Vector view sharing storage with self'''
+		return Vector._view(self.dat, self.m, 1, self.off + j*self.cs, self.rs, 1)
 
 	def sub(self, i, j):
-		'''Submatrix of self formed by removing row i and column j'''
+		'''Submatrix of self formed by removing row i and column j, as new Matrix'''
 		return Matrix([[self[k+int(k>=i), l+int(l>=j)] for l in range(self.n-1)] for k in range(self.m-1)])
 
 	def minor(self, i, j):
@@ -99,51 +197,173 @@ class Matrix(object):
 		'''Determinant of self'''
 		assert self.is_square(), 'Determinant of a non-square matrix is undefined'
 
-		if self.m == 1 and self.n == 1:
-			return self[0,0]
-		else:
-			return sum([self[0,i] * self.cofactor(0, i) for i in range(self.n)])
+		return self.factor().det()
 
 	def adj(self):
 		'''Returns adjoint (i.e. transpose of cofactor matrix) of self'''
-		return Matrix([[self.cofactor(i, j) for j in range(len(self.dat[i]))] for i in range(len(self.dat))]).transpose()
+		return Matrix([[self.cofactor(i, j) for j in range(self.n)] for i in range(self.m)]).transpose()
+
+	def factor(self):
+		'''LU factorization of self with partial pivoting, reusable for repeated solves'''
+		return LU(self)
 
 	def inv(self):
 		'''Returns inverse of self'''
-		return self.adj() / self.det()
+		return self.factor().inv()
 
 	def solve(self, b):
 		'''Solves linear system self*x=b for x'''
-		return self.inv() * b
+		return self.factor().solve(b)
+
+	def solve_many(self, B):
+		'''Solves self*X=B for every right-hand side in B using a single factorization'''
+		return self.factor().solve_many(B)
+
+class LU(object):
+	'''Doolittle LU factorization P*A = L*U with partial pivoting, stored compactly as flat row-major list self.dat'''
+
+	def __init__(self, mat):
+		'''Factors square Matrix mat in place on a flat copy of its storage, keeping combined L and U factors as self.dat and the row permutation as self.perm'''
+		assert mat.is_square(), 'LU factorization of a non-square matrix is undefined'
+
+		self.n = n = mat.m
+		self.dat = lu = mat.copy().dat.tolist()
+		self.perm = list(range(n))
+		self.sign = 1
+
+		count('factorizations')
+
+		for k in range(n):
+			kk = k*n + k
+			col = lu[kk::n]
+			p = k + col.index(max(col, key=abs))
+			if lu[p*n + k] == 0:
+				continue  # singular column; det() will report 0 and solve() will refuse
+
+			if p != k:
+				lu[k*n:(k+1)*n], lu[p*n:(p+1)*n] = lu[p*n:(p+1)*n], lu[k*n:(k+1)*n]
+				self.perm[k], self.perm[p] = self.perm[p], self.perm[k]
+				self.sign = -self.sign
+
+			piv = lu[kk]
+			rowk = lu[kk + 1:(k+1)*n]
+			for i in range(k+1, n):
+				ik = i*n + k
+				f = lu[ik]/piv
+				lu[ik] = f
+				if f != 0:
+					for j, b in enumerate(rowk, ik + 1):
+						lu[j] -= f*b
+
+	def is_singular(self):
+		'''True if any pivot of self is exactly zero'''
+		return any([self.dat[k*self.n + k] == 0 for k in range(self.n)])
+
+	def det(self):
+		'''Determinant of the factored matrix as signed product of pivots'''
+		out = self.sign
+		for k in range(self.n):
+			out *= self.dat[k*self.n + k]
+		return out
+
+	def _solve(self, b):
+		'''Forward- and back-substitution for a single right-hand side, returned as list'''
+		n = self.n
+		lu = self.dat
+
+		assert len(b) == n, 'Right-hand side dimension must match matrix dimension'
+		assert not self.is_singular(), 'Cannot solve linear system with singular matrix'
+
+		count('solves')
+
+		y = [float(b[i]) for i in self.perm]
+		for i in range(n):
+			start = i*n
+			acc = y[i]
+			for j in range(i):
+				acc -= lu[start + j]*y[j]
+			y[i] = acc
+		for i in reversed(range(n)):
+			start = i*n
+			acc = y[i]
+			for j in range(i+1, n):
+				acc -= lu[start + j]*y[j]
+			y[i] = acc/lu[start + i]
+
+		return y
+
+	def solve(self, b):
+		'''Solves A*x=b for x using the stored factors'''
+		return Vector(self._solve(b))
+
+	def solve_many(self, B):
+		'''Solves A*X=B for the columns of Matrix B, or for each Vector in an iterable B'''
+		if isinstance(B, Matrix) and not isinstance(B, Vector):
+			cols = [self._solve([B[i,j] for i in range(B.m)]) for j in range(B.n)]
+			return Matrix([[col[i] for col in cols] for i in range(self.n)])
+		else:
+			return [Vector(self._solve(b)) for b in B]
+
+	def inv(self):
+		'''Inverse of the factored matrix'''
+		return self.solve_many(Matrix([[float(i == j) for j in range(self.n)] for i in range(self.n)]))
 
 class Vector(Matrix):
-	'''Implementation for Vector as 1d Matrix'''
+	'''Implementation for Vector as 1d Matrix, with entry i at self.off + i*self.rs'''
+
+	__slots__ = ()
 
 	def __init__(self, dat = None):
 		'''Initializes self by storing dat and computing number of entries m'''
-		self.dat = list(dat) if hasattr(dat, "__len__") else dat
-		self.m = len(dat) if hasattr(dat, "__len__") else dat is not None
+		self.dat = array('d', dat) if hasattr(dat, '__len__') else array('d', [dat])
+		self.m = len(self.dat)
+		self.n = 1
+		self.off, self.rs, self.cs = 0, 1, 1
+
+	@classmethod
+	def zeros(cls, m):
+		'''Vector of m zeros'''
+		return Vector._view(array('d', [0.0])*m, m, 1, 0, 1, 1)
 
 	def __len__(self):
 		'''Returns number of entries in self'''
-		return len(self.dat)
+		return self.m
 
 	def __getitem__(self, i):
-		'''Gets ith entry in self'''
-		return self.dat[i]
+		'''Gets ith entry in self, or a list of entries for slice i'''
+		if isinstance(i, slice):
+			return [self[k] for k in range(*i.indices(self.m))]
+		return self.dat[self._index(i)]
 
 	def __setitem__(self, i, val):
 		'''Sets ith entry in self to val'''
-		self.dat[i] = val
+		self.dat[self._index(i)] = val
+
+	def _index(self, i, j = 0):
+		'''Storage index of entry i, which may count from the end'''
+		i = i if i >= 0 else i + self.m
+		if not 0 <= i < self.m:
+			raise IndexError('Vector index out of range')
+		return self.off + i*self.rs
 
 	def __str__(self):
 		'''Prints data stored in self'''
-		return str(self.dat)
+		return str(list(self))
 
 	def __iter__(self):
-		'''Initializes iterator for self as iterator through self.dat'''
-		return iter(self.dat)
-
-	def __next__(self):
-		'''Increments iterator for self by stepping through self.dat'''
-		return next(self.dat)
+		'''Initializes iterator for self over its entries'''
+		if self.rs == 1:
+			return iter(self.dat[self.off:self.off + self.m])
+		return iter([self.dat[self.off + i*self.rs] for i in range(self.m)])
+
+	def tolist(self):
+		'''Entries of self as list'''
+		return list(self)
+
+	def _indices(self):
+		'''Storage index of every entry of self'''
+		return [self.off + i*self.rs for i in range(self.m)]
+
+	def copy(self):
+		'''Compact copy of self'''
+		return Vector(list(self))
@@ -0,0 +1,70 @@
+from __future__ import division
+
+import numpy as np
+
+def rotations(angles):
+	'''Stacked matrices rotating points by each of angles about the z (rotor) axis, as array of shape (len(angles), 3, 3)'''
+	angles = np.asarray(angles, dtype=float)
+	c = np.cos(angles)
+	s = np.sin(angles)
+
+	out = np.zeros((len(angles), 3, 3))
+	out[:, 0, 0] = c
+	out[:, 0, 1] = -s
+	out[:, 1, 0] = s
+	out[:, 1, 1] = c
+	out[:, 2, 2] = 1
+	return out
+
+class Rotor(object):
+	'''Blades of a rotor as rotated copies of one shared point grid, materialized only when accessed'''
+
+	def __init__(self, pts, num_blades, offsets=None):
+		'''Stores grid pts (e.g. from Bamberger.gen_arr(), last axis xyz) uncopied as self.base and blade angles as self.angles
+
+		Blade i sits at 2*pi*i/num_blades plus offsets[i] radians, so offsets give the uneven spacing of noise-tuned fans. Blade 0 at angle 0 is self.base itself.
+		'''
+		assert num_blades > 0, 'A rotor needs at least one blade'
+
+		self.base = pts
+		self.angles = 2*np.pi*np.arange(num_blades)/num_blades
+
+		if offsets is not None:
+			assert len(offsets) == num_blades, 'One angular offset per blade is required'
+			self.angles = self.angles + np.asarray(offsets, dtype=float)
+
+		self.rot = rotations(self.angles)
+
+	def __len__(self):
+		'''Number of blades'''
+		return len(self.angles)
+
+	def __getitem__(self, i):
+		'''Points of blade i'''
+		return self.blade(i)
+
+	def __iter__(self):
+		'''Points of each blade in turn, reusing one buffer so only one rotated copy exists at a time'''
+		buf = None
+		for i in range(len(self)):
+			if self.angles[i] == 0:
+				yield self.base
+			else:
+				buf = self.blade(i, buf)
+				yield buf
+
+	def blade(self, i, out=None):
+		'''Points of blade i, written into out if given; blade at angle 0 is self.base itself unless out is given'''
+		if self.angles[i] == 0 and out is None:
+			return self.base
+		return np.matmul(self.base, self.rot[i].T, out=out)
+
+	def gen_all(self, out=None):
+		'''Points of every blade by one batched rotation, as array of shape (len(self),) + self.base.shape'''
+		if out is None:
+			out = np.empty((len(self),) + self.base.shape)
+		return np.einsum('bij,...j->b...i', self.rot, self.base, out=out)
+
+def assemble(blade, num_blades, num_secs, num_pts, f=lambda t: t, offsets=None):
+	'''Rotor of num_blades copies of blade.gen_arr(num_secs, num_pts, f), generated once'''
+	return Rotor(blade.gen_arr(num_secs, num_pts, f), num_blades, offsets)
@@ -1,5 +1,11 @@
-from blade import Bamberger
-from helper import linspace
+from __future__ import division
+
+from math import cos, exp, e
+
+from blade import Bamberger, NACA4m
+from helper import linspace, interp
+from linalg import Matrix, Vector
+from function import Function, Sum, Product, Composite, Piecewise, Sin, Power, Sqrt, Constant, Polynomial
 
 import dis
 
@@ -15,18 +21,364 @@ def test_381_init():
 	α = [0, 0.0855, 0.0681, 0.0297, 0]
 	λ = [0.209, -0.279, 0.768]
 
+	φ = 0.5
+
 	c = [cdi*di for (cdi, di) in zip(cd, linspace(ν*d, d, len(cd)))]
 
-	blade = Bamberger(d, ν, cd, a, ta, k, tk, α, λ)
+	blade = Bamberger(d, ν, φ, cd, k, tk, a, ta, α, λ)
 
 	# Check chord length
-	assert round(blade.section(blade.rh).c, 6) == round(c[0], 6)
-	assert round(blade.section(blade.rt).c, 6) == round(c[-1], 6)
+	assert round(blade.sec(blade.rh).c, 6) == round(c[0], 6)
+	assert round(blade.sec(blade.rt).c, 6) == round(c[-1], 6)
 
 	# Check (u, w) at known locations on hub
-	prof = blade.profile(blade.rh)
+	prof = blade.sec(blade.rh).profile
 	assert prof['upper'](0.1) != prof['lower'](0.1)  # :)
 
-tests = [test_381_init]
+def test_lu_solve():
+	A = Matrix([[0, 2, 1], [1, 1, 1], [2, 1, 3]])
+	b = Vector([1, 2, 3])
+
+	# Pivoting is required since A[0,0] == 0
+	assert round(A.det(), 12) == -3
+	assert all([round(bi - Axi, 12) == 0 for bi, Axi in zip(b, A*A.solve(b))])
+
+	# One factorization serves every right-hand side
+	lu = A.factor()
+	X = lu.solve_many(Matrix([[1, 0], [0, 1], [0, 0]]))
+	assert all([round(X[i,j] - A.inv()[i,j], 12) == 0 for i in range(3) for j in range(2)])
+
+def test_matrix_views():
+	A = Matrix([[1, 2, 3], [4, 5, 6]])
+	x = Vector([1, -1])
+
+	# Transposes, blocks, rows and columns read through to the same storage
+	At = A.transpose()
+	assert (At.m, At.n) == (3, 2) and At.tolist() == [[1, 4], [2, 5], [3, 6]]
+	assert list(At*x) == [-3, -3, -3]
+	assert A.block(0, 2, 1, 3).tolist() == [[2, 3], [5, 6]] and At.block(1, 3, 0, 1).tolist() == [[2], [3]]
+	assert list(A.row(1)) == [4, 5, 6] and list(A.col(2)) == [3, 6] and list(At.row(2)) == [3, 6]
+
+	# Negative indices count from the end of the view, and indices past it raise instead of reading neighbouring entries
+	assert A[-1, -1] == 6 and A.block(0, 1, 0, 2)[-1, -1] == 2 and At.block(1, 3, 0, 2)[-1, 0] == 3 and A.row(0)[-1] == 3
+	for view, inds in ((A.block(0, 1, 0, 2), (0, 2)), (A.block(0, 1, 0, 2), (-2, 0)), (A.row(0), 3), (A.col(1), -3)):
+		try:
+			view[inds]
+		except IndexError:
+			continue
+		assert False, 'Index outside view must raise IndexError'
+
+	# In-place operations on views write through to the viewed entries only
+	B = A.block(0, 2, 1, 3)
+	B += Matrix([[10, 20], [30, 40]])
+	c = A.col(0)
+	c *= 2
+	r = At.row(1)
+	r += 100
+	assert A.tolist() == [[2, 112, 23], [8, 135, 46]]
+	B *= 0.5
+	assert A.tolist() == [[2, 56, 11.5], [8, 67.5, 23]] and At.copy().tolist() == [[2, 8], [56, 67.5], [11.5, 23]]
+
+def test_naca4m_bounds_arr():
+	sec = NACA4m(0.1, 0.05, 0.4, 0.1, 0.3)
+	t = linspace(0, 1, 101)
+
+	# Array evaluation must agree with per-point evaluation on both sides of tk and ta
+	arr = sec.bounds_arr(t)
+	for key, curve in sec.profile.items():
+		for i, ti in enumerate(t):
+			u, w = curve(ti)
+			assert round(u - arr[key][0][i], 12) == 0 and round(w - arr[key][1][i], 12) == 0
+
+def test_centroid():
+	secs = [NACA4m(0.2, 0, 0.4, 0.1, 0.3), NACA4m(0.2, 0.05, 0.4, 0.1, 0.3), NACA4m(1.0, 0.06, 0.6, 0.12, 0.15), NACA4m(0.2, 0.05, 0, 0.1, 0.3)]
+
+	# Symmetric section has its centroid on the chord line
+	assert abs(secs[0].centroid()[1]) < 1e-12
+
+	# Vectorized path must agree with the per-section path, also where tk == 0 leaves an empty panel
+	for sec, (u0, w0) in zip(secs, NACA4m.centroids(secs)):
+		u, w = sec.centroid()
+		assert abs(u - u0) < 1e-9*sec.c and abs(w - w0) < 1e-9*sec.c
+
+def test_interp():
+	x = linspace(0, 1, 7)
+	y = [1, 0.5, -0.2, 0.1, 0.8, 0.3, 0]
+
+	# Monomial (Horner) and barycentric forms describe the same polynomial
+	p = interp(x, y)
+	b = interp(x, y, form='barycentric')
+	assert all([round(p(xi) - yi, 9) == 0 and b(xi) == yi for xi, yi in zip(x, y)])
+	assert all([round(p(t) - b(t), 12) == 0 for t in linspace(0, 1, 23)])
+
+def test_function_compile():
+	f = Sum([Composite(Sin(2, 0.1), Polynomial([1, 2, 3])), Product([Constant(2), Constant(3), Sin(2, 0.1)]), Piecewise([Power(1, 2), Sqrt(1)], 0.5)])
+	kern = f.compile()
+
+	# Constant factors fold and the repeated Sin(2, 0.1) is evaluated once
+	assert kern.source.count('np.sin(') == 2
+
+	t = linspace(0, 1, 11)
+	assert all([round(fi - f(ti), 12) == 0 for fi, ti in zip(kern(t), t)])
+
+def test_quad():
+	f = Piecewise([Sin(3), Sum([Sqrt(1), Constant(2)])], 0.4)
+	exact = (1 - cos(1.2))/3 + 2/3*(1 - 0.4**1.5) + 2*0.6
+
+	# Adaptive quadrature splits at the jump in f instead of smearing across it
+	assert f.breaks() == [0.4]
+	assert abs(f.int(0, 1, abstol=1e-12, reltol=1e-12) - exact) < 1e-10
+
+	# Closed-form antiderivatives are used where every branch has one, and stay continuous across bounds
+	g = Piecewise([Power(3, 2), Sum([Sqrt(1), Constant(2)])], 0.4)
+	assert abs(g.int(0, 1) - (0.4**3 + 2/3*(1 - 0.4**1.5) + 2*0.6)) < 1e-12
+	assert abs(Sum([Sin(3), Constant(1)]).int(0, 1) - ((1 - cos(3))/3 + 1)) < 1e-10
+
+	# Functions that only define a scalar __call__ still integrate, alone or inside a tree
+	class Exp(Function):
+		def __call__(self, t):
+			return exp(t)
+
+	assert abs(Exp().int(0, 1) - (e - 1)) < 1e-10
+	assert abs(Sum([Exp(), Sin(3)]).int(0, 1) - (e - 1 + (1 - cos(3))/3)) < 1e-10
+
+def test_fit_surf():
+	from bspline import fit_surf, knot_arr, greville
+
+	u = linspace(0, 1, 12)
+	v = linspace(0, 1, 5)
+	pts = [[(ui, vi, (ui - 0.5)**3 + ui*vi) for ui in u] for vi in v]
+
+	# Interpolation reproduces the grid at the Greville abscissae of custom knots
+	ku = knot_arr(3, len(u), lambda t: t**1.5)
+	kv = knot_arr(3, len(v))
+	surf = fit_surf(pts, knots_u=ku, knots_v=kv)
+	assert abs(surf.grid(greville(3, ku), greville(3, kv)) - pts).max() < 1e-12
+
+	# Default chord-length parameterization interpolates as well
+	surf = fit_surf(pts)
+	assert surf.ctrl.shape == (len(v), len(u), 3)
+
+def test_dual():
+	from dual import Dual, derivative, seed, solve
+
+	# Forward mode differentiates Function trees, including through Piecewise branches
+	f = Sum([Composite(Sin(2, 0.1), Polynomial([1, 2, 3])), Piecewise([Power(1, 2), Sqrt(1)], 0.5)])
+	for t in (0.3, 0.7):
+		assert abs(derivative(f, t) - (f(t + 1e-6) - f(t - 1e-6))/2e-6) < 1e-7
+
+	# Implicit differentiation of a linear solve matches the analytic sensitivity of x = b/a
+	a, b = seed([2.0, 3.0])
+	x, = solve([[a]], [b])
+	assert abs(x.val - 1.5) < 1e-15 and abs(x.grad[0] + 0.75) < 1e-15 and abs(x.grad[1] - 0.5) < 1e-15
+
+	# Interpolants carry sensitivities to their data
+	p = interp(linspace(0, 1, 3), seed([1, 0.5, 2]))
+	assert all([abs(gi - wi) < 1e-12 for gi, wi in zip(p(0.25).grad, (0.375, 0.75, -0.125))])
+
+def test_set():
+	inputs = [0.381, 0.387, 0.5, [0.33, 0.13, 0.12], [0, 0.056, 0.059], [0.7, 0.2, 0.56], [0.12, 0.05, 0.051], [0.13, 0.1, 0.33], [0, 0.0855, 0.0681, 0.0297, 0], [0.209, -0.279, 0.768]]
+	blade = Bamberger(*inputs)
+	blade.gen_arr(8, 20)
+
+	# Sweep edits keep the cached section profiles and regenerate the same points as a fresh blade
+	blade.set(sweep_in=[0.1, 0.2, 0.3])
+	assert len(blade.memo['sections']) == 1 and len(blade.memo['stations']) == 0
+	assert abs(blade.gen_arr(8, 20) - Bamberger(*(inputs[:-1] + [[0.1, 0.2, 0.3]])).gen_arr(8, 20)).max() == 0
+
+def test_gen_grad():
+	inputs = [0.381, 0.387, 0.5, [0.33, 0.13, 0.12], [0, 0.056, 0.059], [0.7, 0.2, 0.56], [0.12, 0.05, 0.051], [0.13, 0.1, 0.33], [0, 0.0855, 0.0681, 0.0297, 0], [0.209, -0.279, 0.768]]
+	pts, grads, names = Bamberger(*inputs).gen_grad(4, 10)
+
+	def moved(i, k, h):
+		args = [list(it) if isinstance(it, list) else it for it in inputs]
+		if k is None:
+			args[i] += h
+		else:
+			args[i][k] += h
+		return Bamberger(*args).gen(4, 10)
+
+	# Sensitivities chained through the station values match central differences of gen()
+	for name, i, k in (('d', 0, None), ('aoa_in[2]', 8, 2), ('ta_in[1]', 7, 1), ('sweep_in[2]', 9, 2)):
+		j = names.index(name)
+		hi, lo = moved(i, k, 1e-6), moved(i, k, -1e-6)
+		for key in pts:
+			for s, row in enumerate(grads[key]):
+				for q, g in enumerate(row):
+					assert all([abs(g[c][j] - (hi[key][s][q][c] - lo[key][s][q][c])/2e-6) < 1e-7 for c in range(3)])
+
+def test_spline():
+	x = linspace(0, 1, 25)
+	y = [float(xi > 0.5) for xi in x]
+
+	# Splines pass through their knots; the monotone form does not overshoot a step
+	for form in ('natural', 'clamped', 'pchip'):
+		s = interp(x, y, form, slopes=(0, 0))
+		assert all([abs(s(xi) - yi) < 1e-12 for xi, yi in zip(x, y)])
+
+	s = interp(x, y, 'pchip')
+	assert all([0 <= s(t) <= 1 + 1e-12 for t in linspace(0, 1, 301)])
+
+	# A natural spline reproduces straight lines exactly
+	s = interp(x, [2*xi - 1 for xi in x], 'natural')
+	assert all([abs(s(t) - (2*t - 1)) < 1e-12 for t in linspace(0, 1, 37)])
+
+def test_rotor():
+	from rotor import Rotor
+	import numpy as np
+
+	pts = np.array([[[[1.0, 0, 0.5], [0, 2.0, -0.5]]]])
+	rotor = Rotor(pts, 4, offsets=[0, 0, 0.1, 0])
+
+	# Blades share the base grid until accessed, and the batched rotation matches per-blade access
+	assert rotor[0] is pts
+	assert abs(rotor.gen_all()[2] - rotor[2]).max() < 1e-15
+	assert abs(rotor[1][0, 0, 0] - [0, 1, 0.5]).max() < 1e-15
+	assert abs(rotor[2][0, 0, 0] - [np.cos(np.pi + 0.1), np.sin(np.pi + 0.1), 0.5]).max() < 1e-15
+
+def test_export():
+	from export import write_stl, write_rotor_stl, write_plot3d, write_npy, stl_facet
+	from rotor import Rotor
+	import os, shutil, tempfile
+	import numpy as np
+
+	inputs = [0.381, 0.387, 0.5, [0.33, 0.13, 0.12], [0, 0.056, 0.059], [0.7, 0.2, 0.56], [0.12, 0.05, 0.051], [0.13, 0.1, 0.33], [0, 0.0855, 0.0681, 0.0297, 0], [0.209, -0.279, 0.768]]
+	blade = Bamberger(*inputs)
+	pts = blade.gen_arr(5, 12)
+
+	root = tempfile.mkdtemp()
+	try:
+		# Binary STL: 80-byte header, triangle count, then two triangles per quad of each surface, 50 bytes each
+		path = os.path.join(root, 'blade.stl')
+		write_stl(path, blade, 5, 12)
+		num_tris = 2*2*4*11
+		with open(path, 'rb') as f:
+			assert np.frombuffer(f.read(84)[80:], '<u4')[0] == num_tris
+		assert os.path.getsize(path) == 84 + 50*num_tris
+
+		facets = np.fromfile(path, dtype=stl_facet, offset=84).reshape(4, 2, 2, 11)
+		assert abs(np.linalg.norm(facets['normal'], axis=-1) - 1).max() < 1e-6
+
+		# Normals follow the vertex winding and face away from the opposite surface
+		v = facets['verts'].astype(float)
+		assert (np.sum(np.cross(v[..., 1, :] - v[..., 0, :], v[..., 2, :] - v[..., 0, :])*facets['normal'], axis=-1) > 0).all()
+		mid = v.mean(axis=-2)
+		thick = mid[:, 0] - mid[:, 1]
+		assert (np.sum(facets['normal'][:, 0]*thick, axis=-1) > 0).all() and (np.sum(facets['normal'][:, 1]*thick, axis=-1) < 0).all()
+
+		# A rotor holds one such surface per blade
+		path = os.path.join(root, 'rotor.stl')
+		write_rotor_stl(path, Rotor(pts, 3))
+		assert os.path.getsize(path) == 84 + 50*3*num_tris
+
+		# Plot3D: block count and (num_pts, num_secs, 1) per block, then X, Y and Z planes of each block with points fastest
+		path = os.path.join(root, 'blade.xyz')
+		write_plot3d(path, blade, 5, 12)
+		assert list(np.fromfile(path, '<i4', 7)) == [2, 12, 5, 1, 12, 5, 1]
+		assert os.path.getsize(path) == 28 + 2*3*5*12*8
+		assert (np.fromfile(path, '<f8', offset=28).reshape(2, 3, 5, 12) == pts.transpose(0, 3, 1, 2)).all()
+
+		# .npy output round-trips to gen_arr()
+		path = os.path.join(root, 'blade.npy')
+		out = write_npy(path, blade, 5, 12)
+		assert out.shape == pts.shape and (out == pts).all() and (np.load(path) == pts).all()
+		del out
+	finally:
+		shutil.rmtree(root)
+
+def test_sweep():
+	from batch import sweep
+	import os
+	import numpy as np
+
+	inputs = [0.381, 0.387, 0.5, [0.33, 0.13, 0.12], [0, 0.056, 0.059], [0.7, 0.2, 0.56], [0.12, 0.05, 0.051], [0.13, 0.1, 0.33], [0, 0.0855, 0.0681, 0.0297, 0], [0.209, -0.279, 0.768]]
+	designs = [inputs, inputs[:7] + [[0.13, 0.1, -0.2]] + inputs[8:], dict(zip(Bamberger(*inputs).inputs, inputs[:2] + [0.6] + inputs[3:]))]
+	shm = '/dev/shm'
+	before = set(os.listdir(shm)) if os.path.isdir(shm) else None
+
+	# Workers write the same points as serial generation, and a design that raises is reported instead of passing as ok
+	for ordered in (True, False):
+		results = sorted(sweep(designs, 6, 15, workers=2, ordered=ordered), key=lambda res: res.index)
+		assert [res.ok() for res in results] == [True, False, True] and 'ValueError' in results[1].error
+		for res in (results[0], results[2]):
+			params = res.params
+			assert (res.pts == (Bamberger(**params) if isinstance(params, dict) else Bamberger(*params)).gen_arr(6, 15)).all()
+			res.close()
+
+	# Shared memory is released by close(), by failed designs and by a sweep abandoned part way through
+	results = sweep(designs*4, 6, 15, workers=2, chunksize=2)
+	next(results).close()
+	results.close()
+	if before is not None:
+		assert set(os.listdir(shm)) == before
+
+def test_gen_adapt():
+	import numpy as np
+
+	inputs = [0.381, 0.387, 0.5, [0.33, 0.13, 0.12], [0, 0.056, 0.059], [0.7, 0.2, 0.56], [0.12, 0.05, 0.051], [0.13, 0.1, 0.33], [0, 0.0855, 0.0681, 0.0297, 0], [0.209, -0.279, 0.768]]
+	blade = Bamberger(*inputs)
+	ref = blade.stations(200)[0]
+
+	def height(p, a, b):
+		d = b - a
+		s = np.clip(np.sum((p - a)*d, axis=-1)/np.sum(d*d, axis=-1), 0, 1)
+		return np.linalg.norm(p - a - s[..., None]*d, axis=-1)
+
+	# Tighter tolerances take more stations and points, and the surfaces stay within tol of dense generation
+	sizes = []
+	for tol in (1e-3, 1e-4):
+		pts, r, t = blade.gen_adapt(tol)
+		assert pts.shape == (2, len(r), len(t), 3)
+		sizes.append((len(r), len(t)))
+
+		# Chordwise, at the hub, mid and tip stations shared with gen_arr(200, ...)
+		dense = blade.gen_arr(200, 2001)
+		u = np.array(linspace(0, 1, 2001))
+		j = np.clip(np.searchsorted(t, u, side='right') - 1, 0, len(t) - 2)
+		for i in (0, list(r).index(ref[100]), -1):
+			assert height(dense[:, list(ref).index(r[i])], pts[:, i, j], pts[:, i, j + 1]).max() < tol
+
+		# Spanwise, at all 200 stations and the chosen parameters
+		dense = blade.gen_arr(200, len(t), lambda x: float(np.interp(x, linspace(0, 1, len(t)), t)))
+		i = np.clip(np.searchsorted(r, ref, side='right') - 1, 0, len(r) - 2)
+		assert height(dense, pts[:, i], pts[:, i + 1]).max() < tol
+
+	assert sizes[1][0] > sizes[0][0] and sizes[1][1] > sizes[0][1]
+
+def test_instrument():
+	import json
+	import instrument
+	from instrument import Stats, recording
+
+	inputs = [0.381, 0.387, 0.5, [0.33, 0.13, 0.12], [0, 0.056, 0.059], [0.7, 0.2, 0.56], [0.12, 0.05, 0.051], [0.13, 0.1, 0.33], [0, 0.0855, 0.0681, 0.0297, 0], [0.209, -0.279, 0.768]]
+	blade = Bamberger(*inputs)
+	NACA4m.cache.clear()
+	NACA4m.coeffs_cache.clear()
+
+	def work():
+		blade.gen(4, 10)
+		lu = Matrix([[2, 1], [1, 3]]).factor()
+		lu.solve(Vector([1, 2]))
+		lu.solve(Vector([0, 1]))
+
+	# Each of the 4 new sections builds and solves its thickness system once, on top of the explicit factorization and solves
+	with recording() as stats:
+		work()
+	calls = dict([(name, rec['calls']) for name, rec in stats.as_dict()['stages'].items()])
+	assert calls == {'sec': 4, 'coeffs': 4, 'centroid': 4, 'profile': 8, 'transform': 8}
+	assert stats.counters == {'factorizations': 5, 'solves': 6}
+	assert json.loads(stats.to_json())['counters'] == stats.counters
+
+	# Nothing is recorded outside recording(), which restores the enclosing Stats on exit
+	outer = Stats()
+	with recording(outer):
+		with recording() as inner:
+			Matrix([[1]]).factor()
+		assert instrument.active is outer
+	work()
+	assert instrument.active is None and outer.counters == {} and inner.counters == {'factorizations': 1}
+	assert stats.counters == {'factorizations': 5, 'solves': 6}
+
+tests = [test_381_init, test_lu_solve, test_matrix_views, test_naca4m_bounds_arr, test_centroid, test_interp, test_function_compile, test_quad, test_fit_surf, test_dual, test_set, test_gen_grad, test_spline, test_rotor, test_export, test_sweep, test_gen_adapt, test_instrument]
 
 [case() for case in tests]
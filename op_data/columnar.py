@@ -0,0 +1,189 @@
+import csv
+import json
+import os
+import re
+import sys
+
+from array import array
+from collections.abc import Mapping
+
+from native import parse_time
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+try:
+	import pyarrow.csv as pa_csv
+	import pyarrow.parquet as pq
+except ImportError:
+	pa_csv = pq = None
+
+# Columnar layout: <name>.columns/ beside <name>.csv holds one raw float64 array per channel (NaN where the CSV cell is
+# empty or not numeric; timestamps in seconds) and columns.json naming each channel, its unit and its array file, so
+# any channel can be memory-mapped on its own. 'parquet' writes <name>.parquet instead, when pyarrow is installed.
+
+FORMATS = ('csv', 'columnar', 'parquet')
+
+UNIT_RE = re.compile(r'^(.*?)\s*[\[\(]([^\]\)]*)[\]\)]\s*$')
+
+def output_path(csv_path, formats = ('csv',)):
+	stem = os.path.splitext(csv_path)[0]
+	for fmt in FORMATS:
+		if fmt in formats:
+			return {'csv': csv_path, 'columnar': os.path.join(stem + '.columns', 'columns.json'), 'parquet': stem + '.parquet'}[fmt]
+	raise ValueError(f'No known output format among {formats}.')
+
+def split_unit(name):
+	match = UNIT_RE.match(name)
+	return (match.group(1), match.group(2)) if match else (name, '')
+
+def unique_names(names):
+	# Channels of different logs may share a name ('temp' in two .empdat files); repeats get the suffix .1, .2, ... so
+	# every channel stays addressable by name.
+	taken = set(names)
+	seen = set()
+	out = []
+	for name in names:
+		new, i = name, 0
+		while new in seen or (new != name and new in taken):
+			i += 1
+			new = f'{name}.{i}'
+		seen.add(new)
+		out.append(new)
+	return out
+
+def split_header(header):
+	# (name, unit) of every column of a merged CSV header, with unique names
+	names, units = zip(*[split_unit(column) for column in header]) if header else ((), ())
+	return list(zip(unique_names(names), units))
+
+def to_float(cell, is_time):
+	try:
+		return parse_time(cell) if is_time else float(cell)
+	except ValueError:
+		return float('nan')
+
+def write_columnar(csv_path, chunk_rows = 1 << 16):
+	out_dir = os.path.splitext(csv_path)[0] + '.columns'
+	os.makedirs(out_dir, exist_ok=True)
+
+	with open(csv_path, newline='') as f:
+		reader = csv.reader(f)
+		header = next(reader, [])
+
+		channels = [dict(name=name, unit=unit, file=f'{i:04d}.f8') for i, (name, unit) in enumerate(split_header(header))]
+		outs = [open(os.path.join(out_dir, channel['file']), 'wb') for channel in channels]
+		try:
+			num_rows = 0
+			chunk = [array('d') for channel in channels]
+			for row in reader:
+				for i, col in enumerate(chunk):
+					col.append(to_float(row[i], i == 0) if i < len(row) and row[i] != '' else float('nan'))
+				num_rows += 1
+
+				if len(chunk[0]) == chunk_rows:
+					for col, out in zip(chunk, outs):
+						col.tofile(out)
+					chunk = [array('d') for channel in channels]
+
+			for col, out in zip(chunk, outs):
+				col.tofile(out)
+		finally:
+			for out in outs:
+				out.close()
+
+	with open(os.path.join(out_dir, 'columns.json'), 'w') as f:
+		json.dump({'rows': num_rows, 'dtype': '<f8' if sys.byteorder == 'little' else '>f8', 'channels': channels}, f, indent=1)
+
+	return os.path.join(out_dir, 'columns.json')
+
+def write_parquet(csv_path):
+	if pq is None:
+		raise ImportError('Parquet output requires pyarrow.')
+
+	# Renamed columns keep their unit behind the new name, where ParquetColumns finds it
+	with open(csv_path, newline='') as f:
+		header = next(csv.reader(f), [])
+	names = [column if split_unit(column)[0] == name else f'{name} [{unit}]' if unit else name for column, (name, unit) in zip(header, split_header(header))]
+
+	path = os.path.splitext(csv_path)[0] + '.parquet'
+	reader = pa_csv.open_csv(csv_path, read_options=pa_csv.ReadOptions(column_names=names, skip_rows=1))
+	with pq.ParquetWriter(path, reader.schema) as writer:
+		for batch in reader:
+			writer.write_batch(batch)
+	return path
+
+def convert(csv_path, formats = ('csv',)):
+	if 'columnar' in formats:
+		write_columnar(csv_path)
+	if 'parquet' in formats:
+		write_parquet(csv_path)
+	if 'csv' not in formats:
+		os.remove(csv_path)
+	return output_path(csv_path, formats)
+
+class Columns(Mapping):
+	# Lazily memory-mapped channels of one .columns directory, keyed by channel name.
+
+	def __init__(self, path):
+		self.dir = path if os.path.isdir(path) else os.path.dirname(path)
+		with open(os.path.join(self.dir, 'columns.json')) as f:
+			self.header = json.load(f)
+
+		self.units = dict((channel['name'], channel['unit']) for channel in self.header['channels'])
+		self.files = dict((channel['name'], channel['file']) for channel in self.header['channels'])
+		self.maps = {}
+
+	def __getitem__(self, name):
+		if name not in self.maps:
+			path = os.path.join(self.dir, self.files[name])
+			if np is None:
+				raise ImportError('Memory-mapping columns requires numpy.')
+			self.maps[name] = np.memmap(path, dtype=self.header['dtype'], mode='r', shape=(self.header['rows'],)) if self.header['rows'] else np.empty(0)
+		return self.maps[name]
+
+	def __iter__(self):
+		return iter(self.files)
+
+	def __len__(self):
+		return len(self.files)
+
+class ParquetColumns(Mapping):
+	# Channels of one .parquet file, each read from disk only when first accessed.
+
+	def __init__(self, path):
+		if pq is None:
+			raise ImportError('Reading Parquet output requires pyarrow.')
+		self.file = pq.ParquetFile(path)
+		self.names = self.file.schema_arrow.names
+		self.units = dict((name, split_unit(name)[1]) for name in self.names)
+		self.cols = {}
+
+	def __getitem__(self, name):
+		if name not in self.cols:
+			self.cols[name] = self.file.read(columns=[name]).column(0).to_numpy()
+		return self.cols[name]
+
+	def __iter__(self):
+		return iter(self.names)
+
+	def __len__(self):
+		return len(self.names)
+
+def open_campaign(root):
+	# Maps every merged output under root, as the path of its CSV relative to root without extension (e.g. 'test000/data'
+	# after merge.merge_leaves, 'test000' after parse.merge_files), to its channels. Only the small headers are read here;
+	# channel data is mapped or read on first access.
+	campaign = {}
+	for branch, twigs, leaves in os.walk(root):
+		for twig in twigs:
+			if twig.endswith('.columns') and os.path.exists(os.path.join(branch, twig, 'columns.json')):
+				campaign[os.path.relpath(os.path.join(branch, twig[:-len('.columns')]), root)] = Columns(os.path.join(branch, twig))
+		for leaf in leaves:
+			key = os.path.relpath(os.path.join(branch, leaf[:-len('.parquet')]), root)
+			if leaf.endswith('.parquet') and pq is not None and key not in campaign:
+				campaign[key] = ParquetColumns(os.path.join(branch, leaf))
+		twigs[:] = [twig for twig in twigs if not twig.endswith('.columns')]
+	return campaign
@@ -1,7 +1,15 @@
 import os
 import re
+import csv
+import json
+import hashlib
 
-from subprocess import run
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import run, CalledProcessError, TimeoutExpired
+
+from native import merge_streams
+from columnar import convert, output_path
 
 class MergeException(Exception):
 	def __init__(self, *args):
@@ -21,6 +29,14 @@ class DataMergeExeNotFoundException(MergeException):
 	def __init__(self, path):
 		super().__init__('DataMerge.exe not found at ' + path + '.')
 
+class DataMergeTimeoutException(MergeException):
+	def __init__(self, path, timeout):
+		super().__init__(f'DataMerge.exe timed out after {timeout} s merging {path}.')
+
+class DataMergeFailedException(MergeException):
+	def __init__(self, path, err):
+		super().__init__(f'DataMerge.exe failed merging {path}: {err}')
+
 class DaqNotFoundException(MergeException):
 	def __init__(self, path):
 		super().__init__('No file named \'daq\' found at ' + path + '.')
@@ -29,45 +45,195 @@ class EmpdatNotFoundException(MergeException):
 	def __init__(self, path):
 		super().__init__('No files with extension \'.empdat\' found at ' + path + '.')
 
-def merge_leaves(root, ignore_branches = None):
-	datamerge_exe = os.path.expanduser('~\AppData\Roaming\EMP\DataMerge\DataMerge.exe')
-	if not os.path.exists(datamerge_exe):
-		datamerge_exe = os.path.abspath(input('Enter path to DataMerge.exe on this machine, or press [Enter] to abort:'))
-	if datamerge_exe == '':
-		print('Program aborted.')
+LOG_RE = re.compile(r'log|lab(?=.*\.empdat)')
+
+Branch = namedtuple('Branch', ['path', 'daq', 'logs', 'csv', 'ignored'])
+
+def scan(root, ignore_branches = None):
+	ignored = frozenset(map(os.path.normpath, ignore_branches or ()))
+
+	stack = [root]
+	while stack:
+		branch = stack.pop()
+		if os.path.normpath(branch) in ignored:
+			yield Branch(branch, None, [], None, True)
+			continue
+
+		twigs = []
+		daq = None
+		logs = []
+		csv = None
+		try:
+			with os.scandir(branch) as entries:
+				for entry in entries:
+					if entry.is_dir(follow_symlinks=False):
+						twigs.append(entry.path)
+					elif entry.name == 'daq':
+						daq = entry.path
+					elif entry.name == 'data.csv':
+						csv = entry.path
+					elif LOG_RE.match(entry.name):
+						logs.append(entry.path)
+		except OSError:
+			continue
+
+		if daq is not None or logs:
+			yield Branch(branch, daq, sorted(logs), csv, False)
+
+		stack.extend(sorted(twigs, reverse=True))
+
+def run_datamerge(datamerge_exe, branch, logs, csv_path, timeout = None):
+	try:
+		run([datamerge_exe, os.path.join(branch, 'daq'), *logs], input=os.path.abspath(csv_path), text=True, timeout=timeout, check=True)
+	except TimeoutExpired:
+		raise DataMergeTimeoutException(branch, timeout)
+	except (CalledProcessError, OSError) as err:
+		raise DataMergeFailedException(branch, err)
+
+MANIFEST_NAME = '.merge_manifest.json'
+
+def fingerprint(path, hash_contents = False):
+	stat = os.stat(path)
+	out = {'size': stat.st_size, 'mtime': stat.st_mtime}
+	if hash_contents:
+		sha1 = hashlib.sha1()
+		with open(path, 'rb') as f:
+			for chunk in iter(lambda: f.read(1 << 20), b''):
+				sha1.update(chunk)
+		out['sha1'] = sha1.hexdigest()
+	return out
+
+def load_manifest(root):
+	try:
+		with open(os.path.join(root, MANIFEST_NAME)) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+def save_manifest(root, manifest):
+	path = os.path.join(root, MANIFEST_NAME)
+	with open(path + '.tmp', 'w') as f:
+		json.dump(manifest, f, indent=1, sort_keys=True)
+	os.replace(path + '.tmp', path)
+
+def stale_reason(inputs, out_path, record):
+	# inputs maps the base name of every input to its fingerprint, taken before merging so that the manifest records the
+	# inputs a merge actually read.
+	if not os.path.exists(out_path):
+		return 'output missing'
+
+	if record is not None and record.get('failed'):
+		return 'previous merge failed'
+
+	output = fingerprint(out_path)
+	if record is None:
+		if any(new['mtime'] > output['mtime'] for new in inputs.values()):
+			return 'output older than inputs'
 		return None
 
+	if set(record['inputs']) != set(inputs):
+		return 'input files added or removed'
+	for name, new in inputs.items():
+		old = record['inputs'][name]
+		by_hash = 'sha1' in new and 'sha1' in old
+		if new['size'] != old['size'] or (new['sha1'] != old['sha1'] if by_hash else new['mtime'] != old['mtime']):
+			return 'inputs changed'
+	if output['size'] != record['output']['size'] or output['mtime'] != record['output']['mtime']:
+		return 'output modified since merge'
+	return None
+
+def run_native(datamerge_exe, branch, logs, csv_path, timeout = None):
 	try:
+		merge_streams(os.path.join(branch, 'daq'), logs, csv_path)
+	except (OSError, ValueError, UnicodeDecodeError, csv.Error) as err:
+		raise MergeException(f'Native merge failed at {branch}: {err}')
+
+BACKENDS = {'datamerge': run_datamerge, 'native': run_native}
+
+def merge_branch(run_backend, datamerge_exe, branch, logs, csv_path, timeout = None, formats = ('csv',)):
+	run_backend(datamerge_exe, branch, logs, csv_path, timeout)
+	if tuple(formats) != ('csv',) and os.path.exists(csv_path):
+		try:
+			convert(csv_path, formats)
+		except (OSError, ValueError, ImportError) as err:
+			raise MergeException(f'Columnar conversion failed at {branch}: {err}')
+
+def merge_leaves(root, ignore_branches = None, max_workers = None, timeout = None, hash_inputs = False, dry_run = False, backend = 'datamerge', formats = ('csv',)):
+	# backend='native' merges in-process via native.merge_streams, needs no DataMerge.exe and ignores timeout.
+	# formats picks any of 'csv', 'columnar' and 'parquet' (see columnar.py); without 'csv' the merged CSV is removed once
+	# converted. The returned paths, and the manifest's output fingerprint, are of the first format in that order.
+	run_backend = BACKENDS[backend]
+
+	if dry_run or backend != 'datamerge':
+		datamerge_exe = None
+	else:
+		datamerge_exe = os.path.expanduser('~\AppData\Roaming\EMP\DataMerge\DataMerge.exe')
 		if not os.path.exists(datamerge_exe):
-			raise DataMergeExeNotFoundException
+			datamerge_exe = os.path.abspath(input('Enter path to DataMerge.exe on this machine, or press [Enter] to abort:'))
+		if datamerge_exe == '':
+			print('Program aborted.')
+			return None
 
-		csv_paths = []
+	csv_paths = []
 
-		num_failed = 0
-		num_ignored_found = 0
-		for branch, twigs, leaves in os.walk(root):
-			if ignore_branches is not None and os.path.normpath(branch) in map(os.path.normpath, ignore_branches):
-				num_ignored_found += 1
-			else:
-				try:
-					log_re = re.compile('log|lab(?=.*\.empdat)')
-					logs = [os.path.join(branch, leaf) for leaf in filter(log_re.match, leaves)]
+	manifest = load_manifest(root)
+
+	num_failed = 0
+	num_ignored_found = 0
+	try:
+		if datamerge_exe is not None and not os.path.exists(datamerge_exe):
+			raise DataMergeExeNotFoundException(datamerge_exe)
 
-					if not logs == []:
-						if not 'daq' in leaves:
-							raise DaqNotFoundException(branch)
+		jobs = []
+		futures = []
+		with ThreadPoolExecutor(max_workers) as pool:
+			for branch in scan(root, ignore_branches):
+				if branch.ignored:
+					num_ignored_found += 1
+					continue
+
+				try:
+					if not branch.logs == []:
+						if branch.daq is None:
+							raise DaqNotFoundException(branch.path)
 						else:
-							csv_paths.append(os.path.join(branch, 'data.csv'))
+							csv_path = os.path.join(branch.path, 'data.csv')
+							csv_paths.append(output_path(csv_path, formats))
+
+							inputs = dict((os.path.basename(it), fingerprint(it, hash_inputs)) for it in [branch.daq, *branch.logs])
+							reason = stale_reason(inputs, csv_paths[-1], manifest.get(os.path.relpath(branch.path, root)))
+							if reason is not None:
+								jobs.append((branch.path, branch.logs, csv_path, inputs))
+								if dry_run:
+									print(f'Would merge {branch.path} ({reason}).')
+								else:
+									futures.append(pool.submit(merge_branch, run_backend, datamerge_exe, *jobs[-1][:3], timeout, formats))
+					else:
+						raise EmpdatNotFoundException(branch.path)
+
+				except MergeException as merge_err:
+					print(merge_err)
+					num_failed += 1
 
-							if not 'data.csv' in leaves:
-								run([datamerge_exe, os.path.join(branch, 'daq'), *logs], input=os.path.abspath(csv_paths[-1]), text=True)
-					elif 'daq' in leaves:
-						raise EmpdatNotFoundException(branch)
+			if dry_run:
+				print(f'{len(jobs)} of {len(csv_paths)} branches would be merged.')
+				jobs = []
 
+			for (path, logs, csv_path, inputs), future in zip(jobs, futures):
+				try:
+					future.result()
+					out_path = output_path(csv_path, formats)
+					if os.path.exists(out_path):
+						manifest[os.path.relpath(path, root)] = {'inputs': inputs, 'output': fingerprint(out_path)}
 				except MergeException as merge_err:
+					# Whatever output a failed merge left behind must not pass for up to date on the next run
+					manifest[os.path.relpath(path, root)] = {'failed': True}
 					print(merge_err)
 					num_failed += 1
 
+		if jobs:
+			save_manifest(root, manifest)
+
 		if not num_failed == 0:
 			raise IncompleteMergeDoneException(num_failed)
 
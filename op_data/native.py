@@ -0,0 +1,99 @@
+import csv
+import heapq
+import os
+import random
+
+from datetime import datetime
+
+# In-process stand-in for DataMerge.exe. The daq stream and each .empdat log are read as delimited text (comma, tab or
+# semicolon, sniffed per file) whose header row names the channels and whose first column is a timestamp, given either
+# in seconds or in ISO 8601. Rows of all sources are merged in timestamp order (ties keep daq first, then logs in the
+# order given) into one CSV with a row per distinct timestamp, in which every source's channels hold their most recent
+# values. Files are read through fixed-size buffers and rows are written as they are merged, so memory use does not
+# depend on file size.
+
+def parse_time(stamp):
+	try:
+		return float(stamp)
+	except ValueError:
+		return datetime.fromisoformat(stamp).timestamp()
+
+def open_source(path, chunk_size):
+	f = open(path, newline='', buffering=chunk_size)
+	try:
+		dialect = csv.Sniffer().sniff(f.read(min(chunk_size, 1 << 14)), delimiters=',\t;')
+	except csv.Error:
+		dialect = csv.excel
+	f.seek(0)
+
+	reader = csv.reader(f, dialect)
+	header = next(reader, [])
+	return f, header, reader
+
+def source_rows(reader, index, width):
+	for row in reader:
+		if row and row[0].strip():
+			yield parse_time(row[0]), index, row[0], (row[1:] + [''] * width)[:width]
+
+def merge_streams(daq_path, log_paths, csv_path, chunk_size = 1 << 16):
+	files = []
+	try:
+		sources = []
+		for path in [daq_path, *log_paths]:
+			f, header, reader = open_source(path, chunk_size)
+			files.append(f)
+			sources.append((header, reader))
+
+		widths = [max(len(header) - 1, 0) for header, reader in sources]
+		offsets = [sum(widths[:i]) for i in range(len(widths))]
+
+		# Written under a temporary name and moved into place only once complete, so a failed merge leaves no output
+		current = [''] * sum(widths)
+		with open(csv_path + '.tmp', 'w', newline='', buffering=chunk_size) as out:
+			writer = csv.writer(out)
+			writer.writerow(['time'] + [name for header, reader in sources for name in header[1:]])
+
+			prev = None
+			merged = heapq.merge(*[source_rows(reader, i, widths[i]) for i, (header, reader) in enumerate(sources)], key=lambda it: (it[0], it[1]))
+			for time, index, stamp, values in merged:
+				if prev is not None and time != prev[0]:
+					writer.writerow([prev[1]] + current)
+				current[offsets[index]:offsets[index] + widths[index]] = values
+				prev = (time, stamp)
+
+			if prev is not None:
+				writer.writerow([prev[1]] + current)
+		os.replace(csv_path + '.tmp', csv_path)
+	finally:
+		for f in files:
+			f.close()
+		if os.path.exists(csv_path + '.tmp'):
+			os.remove(csv_path + '.tmp')
+
+def make_fixture(root, num_branches = 3, num_rows = 500, seed = 0):
+	# Writes a small campaign of branches, each with a daq stream and two .empdat logs sampled at irregular, interleaved
+	# times, for exercising merge_streams and merge_leaves(backend='native') without DataMerge.exe.
+	rng = random.Random(seed)
+
+	branches = []
+	for i in range(num_branches):
+		branch = os.path.join(root, f'test{i:03d}')
+		os.makedirs(branch, exist_ok=True)
+
+		with open(os.path.join(branch, 'daq'), 'w', newline='') as f:
+			writer = csv.writer(f)
+			writer.writerow(['time', 'p_in', 'p_out', 'rpm'])
+			for j in range(num_rows):
+				writer.writerow([f'{0.01*j:.2f}', f'{101.3 + rng.gauss(0, 0.1):.4f}', f'{101.3 + 0.5*j/num_rows:.4f}', f'{3000 + rng.randint(-5, 5)}'])
+
+		for name, channels, period in (('log.empdat', ['volts', 'amps'], 0.037), ('lab.empdat', ['temp'], 0.25)):
+			with open(os.path.join(branch, name), 'w', newline='') as f:
+				writer = csv.writer(f, delimiter='\t')
+				writer.writerow(['time'] + channels)
+				t = rng.uniform(0, period)
+				while t < 0.01*num_rows:
+					writer.writerow([f'{t:.3f}'] + [f'{rng.uniform(0, 50):.3f}' for channel in channels])
+					t += period
+
+		branches.append(branch)
+	return branches
@@ -1,16 +1,54 @@
 import os
 import ntpath
+from bisect import bisect_left
+from subprocess import run
 
+from columnar import convert, output_path
 
-def merge_files(daqdir, empdir, outdir=None):
+
+def pair_files(daqdir, empdir):
+    # Maps every test in daqdir to the files in empdir whose names start with the test name, listing each directory once.
+    # A file matching several tests (test1 and test10 for test10_log.empdat) goes to the longest of them. Returns the
+    # mapping with the files of empdir that no test claims.
+    tests = sorted(os.listdir(daqdir))
+    names = sorted(os.listdir(empdir))
+
+    owner = {}
+    for test in tests:
+        i = bisect_left(names, test)
+        while i < len(names) and names[i].startswith(test):
+            if len(test) > len(owner.get(names[i], '')):
+                owner[names[i]] = test
+            i += 1
+
+    pairs = dict((test, []) for test in tests)
+    for name in names:
+        if name in owner:
+            pairs[owner[name]].append(os.path.join(empdir, name))
+
+    orphans = [os.path.join(empdir, name) for name in names if name not in owner]
+    return pairs, orphans
+
+
+def merge_files(daqdir, empdir, outdir=None, formats=('csv',)):
+    # formats picks any of 'csv', 'columnar' and 'parquet' per test, as in merge.merge_leaves.
     if outdir is None:
         outdir = os.path.join(os.path.dirname(daqdir), 'merged')
     if not os.path.exists(outdir):
-        os.makedirs(outdirs)
+        os.makedirs(outdir)
     exe = ntpath.abspath('C:/Users/llafave/AppData/Roaming/EMP/DataMerge/DataMerge.exe')
-    for test in os.listdir(daqdir):
-        target = os.path.join(outdir, test+'.csv')
-        if not os.path.exists(target):
-            rename = re.compile(test+'.*')
-            empfiles = [os.path.join(empdir, fname) for fname in os.listdir(empdir) if rename.match is not None]
-            run([exe, os.path.join(daqdir, test), *empfiles], input=target, text=True)
+
+    pairs, orphans = pair_files(daqdir, empdir)
+    for path in orphans:
+        print(f'No test in {daqdir} for log {path}.')
+    for test, empfiles in pairs.items():
+        if not empfiles:
+            print(f'No logs in {empdir} for test {test}; not merged.')
+
+    jobs = [(test, empfiles, os.path.join(outdir, test+'.csv')) for test, empfiles in pairs.items() if empfiles]
+    jobs = [job for job in jobs if not os.path.exists(output_path(job[2], formats))]
+    for test, empfiles, target in jobs:
+        run([exe, os.path.join(daqdir, test), *empfiles], input=target, text=True)
+        if tuple(formats) != ('csv',) and os.path.exists(target):
+            convert(target, formats)
+    return pairs, orphans
@@ -0,0 +1,157 @@
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import merge
+
+from columnar import Columns, write_columnar
+from native import make_fixture, merge_streams, parse_time
+from parse import pair_files
+
+def read_rows(path, delimiter = ','):
+	with open(path, newline='') as f:
+		return list(csv.reader(f, delimiter=delimiter))
+
+def test_merge_streams():
+	root = tempfile.mkdtemp()
+	try:
+		branch, = make_fixture(root, 1, 200)
+		sources = [(os.path.join(branch, 'daq'), ','), (os.path.join(branch, 'log.empdat'), '\t'), (os.path.join(branch, 'lab.empdat'), '\t')]
+		out = os.path.join(branch, 'data.csv')
+		merge_streams(sources[0][0], [path for path, delimiter in sources[1:]], out)
+
+		rows = read_rows(out)
+		tables = [read_rows(path, delimiter) for path, delimiter in sources]
+
+		# Columns of daq, then of each log in the order given, behind one time column
+		assert rows[0] == ['time', 'p_in', 'p_out', 'rpm', 'volts', 'amps', 'temp']
+
+		# One row per distinct timestamp of any source, in increasing order
+		times = [parse_time(row[0]) for row in rows[1:]]
+		assert all(prev < curr for prev, curr in zip(times, times[1:]))
+		assert set(times) == set(parse_time(row[0]) for table in tables for row in table[1:])
+
+		# Every source's channels hold its most recent values, blank before its first row
+		offset = 1
+		for table in tables:
+			width = len(table[0]) - 1
+			j = 0
+			latest = [''] * width
+			for time_, row in zip(times, rows[1:]):
+				while j + 1 < len(table) and parse_time(table[j + 1][0]) <= time_:
+					j += 1
+					latest = table[j][1:]
+				assert row[offset:offset + width] == latest
+			offset += width
+	finally:
+		shutil.rmtree(root)
+
+def test_merge_leaves_native():
+	root = tempfile.mkdtemp()
+	lock = threading.Lock()
+	calls = []
+	load = [0, 0]
+
+	def probe(*args):
+		# Native backend that records its calls and the peak number running at once
+		with lock:
+			calls.append(args[1])
+			load[0] += 1
+			load[1] = max(load)
+		try:
+			time.sleep(0.02)
+			merge.run_native(*args)
+		finally:
+			with lock:
+				load[0] -= 1
+
+	merge.BACKENDS['probe'] = probe
+	try:
+		branches = make_fixture(os.path.join(root, 'a'), 4, 100) + make_fixture(os.path.join(root, 'b', 'c'), 2, 100)
+		ignored = os.path.join(root, 'b', 'c', 'test001')
+
+		# The scanner finds nested branches, skips ignored ones, and at most max_workers merges run at once
+		paths = merge.merge_leaves(root, ignore_branches=[ignored], max_workers=2, backend='probe')
+		assert sorted(paths) == sorted(os.path.join(branch, 'data.csv') for branch in branches if branch != ignored)
+		assert all(os.path.exists(path) for path in paths) and not os.path.exists(os.path.join(ignored, 'data.csv'))
+		assert len(calls) == 5 and load[1] == 2
+
+		# Unchanged branches are skipped on the next run; changed inputs and failed merges are redone
+		del calls[:]
+		merge.merge_leaves(root, ignore_branches=[ignored], max_workers=2, backend='probe')
+		assert calls == []
+
+		with open(os.path.join(branches[1], 'lab.empdat'), 'a') as f:
+			f.write('0.999\t1.0\n')
+		with open(os.path.join(branches[2], 'lab.empdat'), 'a') as f:
+			f.write('not a time\t1.0\n')
+		merge.merge_leaves(root, ignore_branches=[ignored], max_workers=2, backend='probe')
+		assert sorted(calls) == [branches[1], branches[2]]
+
+		del calls[:]
+		merge.merge_leaves(root, ignore_branches=[ignored], max_workers=2, backend='probe')
+		assert calls == [branches[2]]
+	finally:
+		del merge.BACKENDS['probe']
+		shutil.rmtree(root)
+
+def test_run_datamerge():
+	root = tempfile.mkdtemp()
+	try:
+		branch, = make_fixture(root, 1, 10)
+		logs = [os.path.join(branch, 'log.empdat')]
+		out = os.path.join(branch, 'data.csv')
+
+		# A missing exe and a nonzero exit status are merge failures; Python stands in for an exe that fails by running daq
+		with open(os.path.join(branch, 'daq'), 'w') as f:
+			f.write('raise SystemExit(3)\n')
+		for exe in (os.path.join(root, 'DataMerge.exe'), sys.executable):
+			try:
+				merge.run_datamerge(exe, branch, logs, out)
+			except merge.DataMergeFailedException:
+				continue
+			assert False, 'Failed DataMerge run must raise DataMergeFailedException'
+	finally:
+		shutil.rmtree(root)
+
+def test_write_columnar():
+	root = tempfile.mkdtemp()
+	try:
+		path = os.path.join(root, 'data.csv')
+		with open(path, 'w', newline='') as f:
+			writer = csv.writer(f)
+			writer.writerow(['time', 'temp [C]', 'rpm', 'temp [F]', 'temp.1'])
+			writer.writerow(['0.0', '20', '3000', '68', '1'])
+			writer.writerow(['0.5', '', 'x', '70', '2'])
+
+		# Repeated channel names get a suffix instead of hiding the earlier channel, and keep their own units
+		cols = Columns(write_columnar(path))
+		assert list(cols) == ['time', 'temp', 'rpm', 'temp.2', 'temp.1']
+		assert [cols.units[name] for name in cols] == ['', 'C', '', 'F', '']
+		assert list(cols['temp.2']) == [68, 70] and list(cols['temp.1']) == [1, 2]
+		assert cols['temp'][0] == 20 and all(cols['temp'][1:] != cols['temp'][1:]) and cols['rpm'][1] != cols['rpm'][1]
+	finally:
+		shutil.rmtree(root)
+
+def test_pair_files():
+	root = tempfile.mkdtemp()
+	try:
+		for name in ('daq/test1', 'daq/test10', 'daq/test3', 'emp/test1_log.empdat', 'emp/test10_log.empdat', 'emp/test10_lab.empdat', 'emp/test2_log.empdat'):
+			os.makedirs(os.path.dirname(os.path.join(root, name)), exist_ok=True)
+			open(os.path.join(root, name), 'w').close()
+
+		# Each log goes to the longest test name it starts with; unclaimed logs and tests without logs are reported
+		pairs, orphans = pair_files(os.path.join(root, 'daq'), os.path.join(root, 'emp'))
+		emp = lambda *names: [os.path.join(root, 'emp', name) for name in names]
+		assert pairs == {'test1': emp('test1_log.empdat'), 'test10': emp('test10_lab.empdat', 'test10_log.empdat'), 'test3': []}
+		assert orphans == emp('test2_log.empdat')
+	finally:
+		shutil.rmtree(root)
+
+tests = [test_merge_streams, test_merge_leaves_native, test_run_datamerge, test_write_columnar, test_pair_files]
+
+[case() for case in tests]